@@ -0,0 +1,313 @@
+"""
+Benchmark the fit and predict scaling of SearchFair.
+
+Every configuration of the grid (dataset, training size, kernel, solver, loss,
+wu_bound, reasonable points) is run in a fresh process, so that the peak
+resident memory is measured for that configuration alone. The results are
+written to a JSON file, and two result files can be compared to catch
+performance regressions.
+
+Run from the root of the repository:
+
+    python -m benchmarks.bench_searchfair run --output before.json
+    python -m benchmarks.bench_searchfair run --output after.json
+    python -m benchmarks.bench_searchfair compare before.json after.json
+"""
+
+import argparse
+import itertools
+import json
+import multiprocessing
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+
+DATASETS = ["gaussian", "adult", "celebA"]
+KEY_FIELDS = [
+    "dataset",
+    "n_train",
+    "kernel",
+    "solver",
+    "loss_name",
+    "wu_bound",
+    "reason_points",
+]
+
+
+def load_data(dataset, n_samples, seed):
+    """Load n_samples points of a dataset, with the same points for a given seed.
+
+    Parameters
+    ----------
+    dataset: str
+        'gaussian' for the synthetic data, or 'adult' or 'celebA' for the cached real datasets.
+    n_samples: int
+        The number of points to load.
+    seed: int
+        The seed of the random number generators used to sample the points.
+
+    Returns
+    ----------
+    x, y, s: numpy arrays
+        The features, class labels and sensitive attribute of the points.
+    """
+    random.seed(seed)
+    np.random.seed(seed)
+    if dataset == "gaussian":
+        from examples.get_synthetic_data import get_gaussian_data
+
+        return get_gaussian_data(n_samples)
+    elif dataset == "adult":
+        from examples.get_real_data import get_adult_data
+
+        return get_adult_data(load_data_size=n_samples)
+    elif dataset == "celebA":
+        from examples.get_real_data import get_celebA_data
+
+        return get_celebA_data(load_data_size=n_samples)
+    raise ValueError("Unknown dataset %s. Choose one of %s." % (dataset, DATASETS))
+
+
+def peak_rss_mb():
+    """Peak resident set size of the current process in MiB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KiB on Linux
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10
+
+
+def run_config(config):
+    """Fit and evaluate SearchFair for one configuration. This is run in its own process.
+
+    Parameters
+    ----------
+    config: dict
+        The configuration, with the fields of KEY_FIELDS and the benchmark settings.
+
+    Returns
+    ----------
+    record: dict
+        The configuration together with the measured times, memory, solves and scores.
+    """
+    from searchfair import SearchFair
+    from examples.utils import compute_fairness_measures, get_accuracy
+
+    record = dict(config)
+    try:
+        n_train, n_test = config["n_train"], config["n_test"]
+        x, y, s = load_data(config["dataset"], n_train + n_test, config["seed"])
+        x_train, y_train, s_train = x[:n_train], y[:n_train], s[:n_train]
+        x_test, y_test, s_test = x[n_train:], y[n_train:], s[n_train:]
+        record["n_train"], record["n_test"] = len(y_train), len(y_test)
+
+        model = SearchFair(
+            kernel=config["kernel"],
+            gamma=config["poly_degree"] if config["kernel"] == "poly" else None,
+            solver=config["solver"],
+            loss_name=config["loss_name"],
+            wu_bound=config["wu_bound"],
+            reason_points=config["reason_points"],
+            max_iter=config["max_iter"],
+            max_search_iter=config["max_search_iter"],
+            random_state=config["seed"],
+        )
+        rss_before_fit = peak_rss_mb()
+
+        start = time.perf_counter()
+        model.fit(x_train, y_train, s_train=s_train)
+        record["fit_time"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        predictions_train = model.predict(x_train)
+        predictions_test = model.predict(x_test)
+        record["predict_time"] = time.perf_counter() - start
+
+        record["peak_rss_mb"] = peak_rss_mb()
+        record["peak_rss_fit_mb"] = record["peak_rss_mb"] - rss_before_fit
+        record["n_solves"] = len(model.n_iter_)
+        record["solver_iterations"] = int(sum(n_iter for _, _, n_iter in model.n_iter_))
+        # The lambda of the chosen weights
+        record["lambda"] = float(model.fairness_lambda)
+        for split, predictions, y_split, s_split in [
+            ("train", predictions_train, y_train, s_train),
+            ("test", predictions_test, y_test, s_test),
+        ]:
+            ddp, deo = compute_fairness_measures(predictions, y_split, s_split)
+            record["accuracy_" + split] = float(get_accuracy(y_split, predictions))
+            record["ddp_" + split] = float(ddp)
+            record["deo_" + split] = float(deo)
+    except Exception as error:
+        record["error"] = "%s: %s" % (type(error).__name__, error)
+    return record
+
+
+def environment():
+    """Versions of the libraries and the commit the benchmark runs on."""
+    import cvxpy
+    import scipy
+    import sklearn
+
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True
+        ).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "numpy": np.__version__,
+        "scipy": scipy.__version__,
+        "cvxpy": cvxpy.__version__,
+        "scikit-learn": sklearn.__version__,
+        "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+
+
+def run(args):
+    configs = [
+        dict(
+            zip(KEY_FIELDS, values),
+            n_test=args.n_test,
+            poly_degree=args.poly_degree,
+            max_iter=args.max_iter,
+            max_search_iter=args.max_search_iter,
+            seed=args.seed,
+        )
+        for values in itertools.product(
+            args.datasets,
+            args.sizes,
+            args.kernels,
+            args.solvers,
+            args.losses,
+            args.wu_bounds,
+            args.reason_points,
+        )
+    ]
+
+    # A new process for every run, so that the peak memory belongs to one configuration
+    context = multiprocessing.get_context("spawn")
+    records = []
+    with context.Pool(processes=1, maxtasksperchild=1) as pool:
+        for i, config in enumerate(configs):
+            repeats = [pool.apply(run_config, (config,)) for _ in range(args.repeat)]
+            record = min(repeats, key=lambda repeat: repeat.get("fit_time", np.inf))
+            if "error" not in record:
+                record["fit_times"] = [repeat["fit_time"] for repeat in repeats if "fit_time" in repeat]
+            records.append(record)
+            print(
+                "[%d/%d] %s" % (i + 1, len(configs), format_key(config)),
+                record["error"]
+                if "error" in record
+                else "fit %.2fs, predict %.3fs, %.0f MiB, %d solves, accuracy %.3f, DDP %.3f"
+                % (
+                    record["fit_time"],
+                    record["predict_time"],
+                    record["peak_rss_mb"],
+                    record["n_solves"],
+                    record["accuracy_test"],
+                    record["ddp_test"],
+                ),
+            )
+
+    with open(args.output, "w") as f:
+        json.dump({"environment": environment(), "results": records}, f, indent=2)
+    print("Results written to", args.output)
+
+
+def format_key(record):
+    return " ".join("%s=%s" % (field, record[field]) for field in KEY_FIELDS)
+
+
+def compare(args):
+    """Compare two result files and report the configurations that got slower or use more memory.
+    The exit status is 1 if any configuration regressed.
+    """
+    with open(args.baseline) as f:
+        baseline = json.load(f)["results"]
+    with open(args.candidate) as f:
+        candidate = json.load(f)["results"]
+
+    key = lambda record: tuple(record[field] for field in KEY_FIELDS)
+    baseline = {key(record): record for record in baseline}
+
+    regressions = 0
+    width = max(len(format_key(record)) for record in candidate)
+    print(
+        "%-*s %9s %9s %9s %7s %9s %9s"
+        % (width, "configuration", "fit", "predict", "rss", "solves", "d_acc", "d_ddp")
+    )
+    for record in candidate:
+        old = baseline.get(key(record))
+        if old is None or "error" in old or "error" in record:
+            status = "missing in baseline" if old is None else (old.get("error") or record.get("error"))
+            print("%-*s %s" % (width, format_key(record), status))
+            continue
+        ratios = {
+            measure: record[measure] / max(old[measure], 1e-12)
+            for measure in ["fit_time", "predict_time", "peak_rss_mb"]
+        }
+        regressed = [measure for measure, ratio in ratios.items() if ratio > 1 + args.threshold]
+        regressions += len(regressed) > 0
+        print(
+            "%-*s %8.2fx %8.2fx %8.2fx %+7d %+9.4f %+9.4f %s"
+            % (
+                width,
+                format_key(record),
+                ratios["fit_time"],
+                ratios["predict_time"],
+                ratios["peak_rss_mb"],
+                record["n_solves"] - old["n_solves"],
+                record["accuracy_test"] - old["accuracy_test"],
+                record["ddp_test"] - old["ddp_test"],
+                "REGRESSION (" + ", ".join(regressed) + ")" if regressed else "",
+            )
+        )
+    print("%d configuration(s) regressed by more than %d%%." % (regressions, args.threshold * 100))
+    return 1 if regressions > 0 else 0
+
+
+def reason_points_type(value):
+    return int(value) if float(value).is_integer() and float(value) > 1 else float(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    parser_run = subparsers.add_parser("run", help="run the benchmark grid")
+    parser_run.add_argument("--output", default="bench_results.json")
+    parser_run.add_argument("--datasets", nargs="+", choices=DATASETS, default=["gaussian"])
+    parser_run.add_argument("--sizes", nargs="+", type=int, default=[200, 400, 800])
+    parser_run.add_argument("--kernels", nargs="+", choices=["linear", "rbf", "poly"], default=["linear", "rbf", "poly"])
+    parser_run.add_argument("--solvers", nargs="+", default=["SCS", "ECOS"])
+    parser_run.add_argument("--losses", nargs="+", choices=["hinge", "squared", "logistic", "exponential"], default=["hinge"])
+    parser_run.add_argument("--wu-bounds", nargs="+", choices=["hinge", "squared", "logistic", "exponential"], default=["hinge"])
+    parser_run.add_argument("--reason-points", nargs="+", type=reason_points_type, default=[0.5])
+    parser_run.add_argument("--n-test", type=int, default=500)
+    parser_run.add_argument("--poly-degree", type=int, default=2)
+    parser_run.add_argument("--max-iter", type=int, default=3000)
+    parser_run.add_argument("--max-search-iter", type=int, default=10)
+    parser_run.add_argument("--repeat", type=int, default=1, help="the fastest of the repeats is reported")
+    parser_run.add_argument("--seed", type=int, default=0)
+
+    parser_compare = subparsers.add_parser("compare", help="compare two result files")
+    parser_compare.add_argument("baseline")
+    parser_compare.add_argument("candidate")
+    parser_compare.add_argument("--threshold", type=float, default=0.1, help="relative slowdown reported as a regression")
+
+    args = parser.parse_args()
+    if args.command == "run":
+        run(args)
+    else:
+        sys.exit(compare(args))
+
+
+if __name__ == "__main__":
+    main()
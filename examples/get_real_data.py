@@ -1,10 +1,152 @@
 #!/usr/bin/env python
 import os
+import hashlib
+import shutil
+import tempfile
 from random import shuffle
 import pandas as pd
 import numpy as np
+from scipy.sparse import csr_matrix
 
-def get_celebA_data(load_data_size=None):
+def load_cached(source_file, options, build):
+    """Load preprocessed arrays from the binary cache next to the source file, or build and cache them.
+    The cache key is a hash of the source file and of the preprocessing options, so a changed file
+    or changed options never return stale arrays. Cached arrays are memory-mapped.
+    Several processes can use the cache at once: each one builds the arrays in its own directory, which is then
+    renamed to the cache key, so the files of a published key are never rewritten.
+
+    Parameters
+    ----------
+    source_file: str
+        The path of the raw data file.
+    options: dict
+        The preprocessing options that the arrays depend on.
+    build: function
+        Builds the arrays (X, y, s) from the source file.
+
+    Returns
+    ---------
+    arrays: tuple
+        The memory-mapped arrays (X, y, s).
+    """
+    key = hashlib.sha1()
+    with open(source_file, 'rb') as f:
+        for block in iter(lambda: f.read(2 ** 20), b''):
+            key.update(block)
+    key.update(repr(sorted(options.items())).encode())
+    cache_dir = os.path.join(os.path.dirname(source_file), 'cache', key.hexdigest())
+    names = ['X', 'y', 's']
+
+    if not os.path.exists(os.path.join(cache_dir, 'done')):
+        os.makedirs(os.path.dirname(cache_dir), exist_ok=True)
+        build_dir = tempfile.mkdtemp(dir=os.path.dirname(cache_dir))
+        for name, array in zip(names, build()):
+            np.save(os.path.join(build_dir, name + '.npy'), array)
+        open(os.path.join(build_dir, 'done'), 'w').close()
+        try:
+            os.rename(build_dir, cache_dir)
+        except OSError:
+            if os.path.exists(os.path.join(cache_dir, 'done')):
+                # Another process published the key first, so its arrays are used
+                shutil.rmtree(build_dir)
+            else:
+                # The key holds an incomplete cache of an older version, which is left alone
+                cache_dir = build_dir
+    return tuple(np.load(os.path.join(cache_dir, name + '.npy'), mmap_mode='r') for name in names)
+
+def reservoir_sample_csv(source_file, sample_size, chunksize=10000, chunk_filter=None, **read_csv_kwargs):
+    """Draw a uniform sample of rows from a csv file, which is read in chunks, with reservoir sampling.
+    Only the sample and one chunk are held in memory.
+
+    Parameters
+    ----------
+    source_file: str
+        The path of the csv file.
+    sample_size: int
+        The number of rows to sample.
+    chunksize: int
+        The number of rows read at once.
+    chunk_filter: function
+        If given, it is applied to each chunk before sampling, e.g. to drop invalid rows.
+    read_csv_kwargs:
+        Further arguments of pandas.read_csv.
+
+    Returns
+    ---------
+    sample: pandas DataFrame
+        The sampled rows.
+    """
+    reservoir = None
+    nmb_seen = 0
+    for chunk in pd.read_csv(source_file, chunksize=chunksize, **read_csv_kwargs):
+        if chunk_filter is not None:
+            chunk = chunk_filter(chunk)
+        chunk = chunk.reset_index(drop=True)
+
+        # The first rows fill the reservoir
+        if reservoir is None:
+            reservoir = chunk.iloc[:sample_size].copy()
+            nmb_fill = len(reservoir)
+        else:
+            nmb_fill = max(0, min(sample_size - len(reservoir), len(chunk)))
+            if nmb_fill > 0:
+                reservoir = pd.concat([reservoir, chunk.iloc[:nmb_fill]], ignore_index=True)
+
+        # Every later row t of the stream replaces a random slot j <= t, if j < sample_size
+        rows = np.arange(nmb_fill, len(chunk))
+        slots = np.floor(np.random.random_sample(len(rows)) * (nmb_seen + rows + 1)).astype(int)
+        rows, slots = rows[slots < sample_size], slots[slots < sample_size]
+        # If several rows draw the same slot, the last one wins, as in the sequential algorithm
+        slots, last = np.unique(slots[::-1], return_index=True)
+        rows = rows[::-1][last]
+        for column in reservoir.columns:
+            values = reservoir[column].to_numpy(copy=True)
+            values[slots] = chunk[column].to_numpy()[rows]
+            reservoir[column] = values
+        nmb_seen += len(chunk)
+    return reservoir
+
+def remove_duplicates_hashed(X, y, s, seen=None):
+    """Remove duplicated points with a hash set of the row bytes, which keeps the first occurrence
+    of each point in its original order, and does not sort the data.
+
+    Parameters
+    ----------
+    X: numpy array
+        The features of the datapoints with shape=(number_points, number_features).
+    y: numpy array
+        The class labels of the datapoints with shape=(number_points,).
+    s: numpy array
+        The binary sensitive attribute of the datapoints with shape=(number_points,).
+    seen: set
+        The rows seen before, e.g. in earlier chunks. It is updated with the new rows.
+
+    Returns
+    ---------
+    X, y, s: numpy arrays
+        The points that were not seen before.
+    """
+    if seen is None:
+        seen = set()
+    X = np.ascontiguousarray(X)
+    keep = []
+    for i, row in enumerate(X):
+        key = row.tobytes()
+        if key not in seen:
+            seen.add(key)
+            keep.append(i)
+    return X[keep], y[keep], s[keep]
+
+def preprocess_celebA_data(df):
+    """Split a DataFrame of the celebA attributes into features, class labels and sensitive attribute."""
+    df = df.rename(columns={'Male': 'sex'})
+
+    s = -1*df['sex']
+    y = df['Smiling']
+    df = df.drop(columns=['sex', 'Smiling','picture_ID'])
+    return df.to_numpy(), y.to_numpy(), s.to_numpy()
+
+def get_celebA_data(load_data_size=None, cache=True, stream=False, chunksize=10000):
     """Load the celebA dataset.
     Source: http://mmlab.ie.cuhk.edu.hk/projects/CelebA.html
 
@@ -12,6 +154,14 @@ def get_celebA_data(load_data_size=None):
     ----------
     load_data_size: int
         The number of points to be loaded. If None, returns all data points unshuffled.
+    cache: bool
+        If True, the parsed data is cached in binary files, and memory-mapped on later loads.
+    stream: bool
+        If True and load_data_size is given, the file is read in chunks and the points are drawn with
+        reservoir sampling, so that only the sample is held in memory. Duplicates are removed with a hash set,
+        and the order of the points is kept.
+    chunksize: int
+        The number of rows read at once for stream=True.
 
     Returns
     ---------
@@ -24,30 +174,28 @@ def get_celebA_data(load_data_size=None):
     """
 
     src_path = os.path.dirname(os.path.realpath(__file__))
-    df = pd.read_csv(os.path.join(src_path, '../data/celebA/list_attr_celeba.csv'), sep=';')
-    df = df.rename(columns={'Male': 'sex'})
+    source_file = os.path.join(src_path, '../data/celebA/list_attr_celeba.csv')
 
-    s = -1*df['sex']
-    y = df['Smiling']
-    df = df.drop(columns=['sex', 'Smiling','picture_ID'])
+    if stream and load_data_size is not None:
+        print("Loading only %d examples from the data" % load_data_size)
+        X, y, s = preprocess_celebA_data(reservoir_sample_csv(source_file, load_data_size, chunksize, sep=';'))
+        X = X[:, (X != 0).any(axis=0)]
+        return remove_duplicates_hashed(X, y, s)
 
-    X = df.to_numpy()
-    y = y.to_numpy()
-    s = s.to_numpy()
+    build = lambda: preprocess_celebA_data(pd.read_csv(source_file, sep=';'))
+    X, y, s = load_cached(source_file, {}, build) if cache else build()
 
     if load_data_size is not None: # Don't shuffle if all data is requested
-    	# shuffle the data
+    	# shuffle the data, and only copy the sampled rows of a memory-mapped cache
     	perm = list(range(0, len(y)))
     	shuffle(perm)
+    	perm = perm[:load_data_size]
+
+    	print("Loading only %d examples from the data" % load_data_size)
     	X = X[perm]
     	y = y[perm]
     	s = s[perm]
 
-    	print("Loading only %d examples from the data" % load_data_size)
-    	X = X[:load_data_size]
-    	y = y[:load_data_size]
-    	s = s[:load_data_size]
-
     X = X[:, (X != 0).any(axis=0)]
 
     #remove duplicates
@@ -55,7 +203,76 @@ def get_celebA_data(load_data_size=None):
 
     return X[unique_indices,:], y[unique_indices], s[unique_indices]
 
-def get_adult_data(load_data_size=None):
+def iter_celebA_data(chunksize=10000):
+    """Read the celebA dataset in chunks, without loading the whole file.
+    Duplicates of points in earlier chunks are removed. All-zero features are kept,
+    so that all chunks have the same features.
+
+    Parameters
+    ----------
+    chunksize: int
+        The number of rows read at once.
+
+    Yields
+    ---------
+    X, y, s: numpy arrays
+        The features, class labels and sensitive attribute of the points of a chunk.
+    """
+    src_path = os.path.dirname(os.path.realpath(__file__))
+    source_file = os.path.join(src_path, '../data/celebA/list_attr_celeba.csv')
+    seen = set()
+    for chunk in pd.read_csv(source_file, sep=';', chunksize=chunksize):
+        X, y, s = remove_duplicates_hashed(*preprocess_celebA_data(chunk), seen=seen)
+        if len(y) > 0:
+            yield X, y, s
+
+ADULT_ATTRS = ['workclass', 'education', 'marital-status', 'occupation', 'relationship', 'native-country']
+ADULT_INT_ATTRS = ['age', 'education-num', 'capital-gain', 'capital-loss', 'hours-per-week', 'fnlwgt']
+
+def clean_adult_data(df):
+    """Drop the points of the Adult dataset with unknown values, and merge the rare countries and education levels."""
+    df = df.drop(['race' ], axis=1)
+    df = df.replace("?", np.nan)
+    df = df.dropna()
+
+    # native country
+    df['native-country'] = np.where(df['native-country'] == "United-States", "US", "NonUS")
+    # education
+    education_map = {}
+    for education in ["Preschool", "1st-4th", "5th-6th", "7th-8th"]:
+        education_map[education] = "prim-middle-school"
+    for education in ["9th", "10th", "11th", "12th"]:
+        education_map[education] = "high-school"
+    df['education'] = df['education'].replace(education_map)
+    return df
+
+def encode_adult_data(df, categories=None, ranges=None):
+    """Encode the cleaned Adult dataset into features, class labels and sensitive attribute.
+    The categorical attributes are one-hot encoded, and the numerical attributes are scaled to [-1, 1].
+
+    Parameters
+    ----------
+    df: pandas DataFrame
+        The cleaned data.
+    categories: dict
+        The categories of each categorical attribute. If None, the categories present in df are used.
+    ranges: tuple
+        The minimum and maximum of each numerical attribute, as pandas Series. If None, they are computed on df.
+    """
+    sensitive_attr_map = {'Male': 1, 'Female': -1}
+    label_map = {'>50K': 1, '<=50K': -1}
+    s = df['sex'].map(sensitive_attr_map).astype(int)
+    y = df['income'].map(label_map).astype(int)
+
+    x_attrs = df[ADULT_ATTRS]
+    if categories is not None:
+        x_attrs = x_attrs.astype({attr: pd.CategoricalDtype(categories[attr]) for attr in ADULT_ATTRS})
+    x_min, x_max = (None, None) if ranges is None else ranges
+    x = pd.concat([pd.get_dummies(x_attrs, prefix=ADULT_ATTRS, drop_first=False, dtype=float),
+                   normalize(x=df[ADULT_INT_ATTRS], x_min=x_min, x_max=x_max)], axis=1)
+    return x.to_numpy(dtype=float), y.to_numpy(), s.to_numpy()
+
+def get_adult_data(load_data_size=None, sparse=False, cache=True, stream=False, chunksize=10000):
     """Load the Adult dataset.
     Source: UCI Machine Learning Repository.
 
@@ -63,10 +280,20 @@ def get_adult_data(load_data_size=None):
     ----------
     load_data_size: int
         The number of points to be loaded. If None, returns all data points unshuffled.
+    sparse: bool
+        If True, the one-hot encoded features are returned as a scipy.sparse CSR matrix.
+    cache: bool
+        If True, the preprocessed data is cached in binary files, and memory-mapped on later loads.
+    stream: bool
+        If True and load_data_size is given, the file is read in chunks and the points are drawn with
+        reservoir sampling, so that only the sample is held in memory. The numerical features are then scaled
+        on the sample. Duplicates are removed with a hash set, and the order of the points is kept.
+    chunksize: int
+        The number of rows read at once for stream=True.
 
     Returns
     ---------
-    X: numpy array
+    X: numpy array or scipy sparse matrix
         The features of the datapoints with shape=(number_points, number_features).
     y: numpy array
         The class labels of the datapoints with shape=(number_points,).
@@ -74,67 +301,83 @@ def get_adult_data(load_data_size=None):
         The binary sensitive attribute of the datapoints with shape=(number_points,).
     """
 
-    def mapping(tuple):
-        # native country
-        tuple['native-country'] = "US" if tuple['native-country'] == "United-States" else "NonUS"
-        # education
-        if tuple['education'] in ["Preschool", "1st-4th", "5th-6th", "7th-8th"]:
-            tuple['education'] = "prim-middle-school"
-        if tuple['education'] in ["9th", "10th", "11th", "12th"]:
-            tuple['education'] = "high-school"
-        return tuple
-
-
     src_path = os.path.dirname(os.path.realpath(__file__))
-    df = pd.read_csv(os.path.join(src_path, '../data/adult/adult.csv'))
-    df = df.drop(['race' ], axis=1)
-    df = df.replace("?", np.nan)
-    df = df.dropna()
-    df = df.apply(mapping, axis=1)
+    source_file = os.path.join(src_path, '../data/adult/adult.csv')
 
-    sensitive_attr_map = {'Male': 1, 'Female': -1}
-    label_map = {'>50K': 1, '<=50K': -1}
-
-    attrs = ['workclass', 'education', 'marital-status', 'occupation', 'relationship', 'native-country']
-    int_attrs = ['age', 'education-num', 'capital-gain', 'capital-loss', 'hours-per-week', 'fnlwgt']
-    
-    s = df['sex'].map(sensitive_attr_map).astype(int)
-    y = df['income'].map(label_map).astype(int)
-
-
-    x = pd.DataFrame(data=None)
-    for x_var in attrs:
-        x = pd.concat([x, pd.get_dummies(df[x_var], prefix=x_var, drop_first=False)], axis=1)
-    for x_var in int_attrs:
-        x = pd.concat([x, normalize(x=df[x_var])], axis=1)
+    if stream and load_data_size is not None:
+        print("Loading only %d examples from the data" % load_data_size)
+        sample = reservoir_sample_csv(source_file, load_data_size, chunksize,
+                                      chunk_filter=lambda chunk: chunk.replace("?", np.nan).dropna())
+        X, y, s = encode_adult_data(clean_adult_data(sample))
+        X = X[:, (X != 0).any(axis=0)]
+        X, y, s = remove_duplicates_hashed(X, y, s)
+        return (csr_matrix(X) if sparse else X), y, s
 
-    X = x.to_numpy()
-    s = s.to_numpy()
-    y = y.to_numpy()
+    build = lambda: encode_adult_data(clean_adult_data(pd.read_csv(source_file)))
+    X, y, s = load_cached(source_file, {'attrs': ADULT_ATTRS, 'int_attrs': ADULT_INT_ATTRS}, build) if cache else build()
 
     if load_data_size is not None: # Don't shuffle if all data is requested
-        # shuffle the data
+        # shuffle the data, and only copy the sampled rows of a memory-mapped cache
         perm = list(range(0, len(y)))
         shuffle(perm)
+        perm = perm[:load_data_size]
+
+        print("Loading only %d examples from the data" % load_data_size)
         X = X[perm]
         y = y[perm]
         s = s[perm]
 
-        print("Loading only %d examples from the data" % load_data_size)
-        X = X[:load_data_size]
-        y = y[:load_data_size]
-        s = s[:load_data_size]
-
     X = X[:, (X != 0).any(axis=0)]
 
     #remove duplicates
     _, unique_indices = np.unique(X, axis=0, return_index=True)
 
+    if sparse:
+        return csr_matrix(X[unique_indices,:]), y[unique_indices], s[unique_indices]
     return X[unique_indices,:], y[unique_indices], s[unique_indices]
 
-def normalize(x):
+def iter_adult_data(chunksize=10000):
+    """Read the Adult dataset in chunks, without loading the whole file.
+    A first pass over the file collects the categories and the ranges of the numerical attributes,
+    so that all chunks have the same features and scaling as get_adult_data. Duplicates of points
+    in earlier chunks are removed.
+
+    Parameters
+    ----------
+    chunksize: int
+        The number of rows read at once.
+
+    Yields
+    ---------
+    X, y, s: numpy arrays
+        The features, class labels and sensitive attribute of the points of a chunk.
+    """
+    src_path = os.path.dirname(os.path.realpath(__file__))
+    source_file = os.path.join(src_path, '../data/adult/adult.csv')
+
+    categories = {attr: set() for attr in ADULT_ATTRS}
+    x_min, x_max = None, None
+    for chunk in pd.read_csv(source_file, chunksize=chunksize):
+        chunk = clean_adult_data(chunk)
+        for attr in ADULT_ATTRS:
+            categories[attr].update(chunk[attr].unique())
+        chunk_min, chunk_max = chunk[ADULT_INT_ATTRS].min(), chunk[ADULT_INT_ATTRS].max()
+        x_min = chunk_min if x_min is None else np.minimum(x_min, chunk_min)
+        x_max = chunk_max if x_max is None else np.maximum(x_max, chunk_max)
+    categories = {attr: sorted(values) for attr, values in categories.items()}
+
+    seen = set()
+    for chunk in pd.read_csv(source_file, chunksize=chunksize):
+        X, y, s = encode_adult_data(clean_adult_data(chunk), categories, (x_min, x_max))
+        X, y, s = remove_duplicates_hashed(X, y, s, seen=seen)
+        if len(y) > 0:
+            yield X, y, s
+
+def normalize(x, x_min=None, x_max=None):
 	# scale to [-1, 1]
-	x_ = (x - x.min()) / (x.max() - x.min()) * 2 - 1
+	if x_min is None:
+		x_min, x_max = x.min(), x.max()
+	x_ = (x - x_min) / (x_max - x_min) * 2 - 1
 	return x_
 
 if __name__=='__main__':
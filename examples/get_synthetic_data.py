@@ -4,19 +4,11 @@ import matplotlib.colors as mcolors
 from random import sample
 from scipy.stats import multivariate_normal
 from scipy.stats import norm as univariate_normal
-from sklearn.linear_model import (
-    LinearRegression,
-)
 from examples.utils import (
     compute_fairness_measures,
-    get_ddp_linear,
-    get_ddp_convex_concave,
-    get_ddp_upper,
-    get_ddp_lower,
+    get_ddp_relaxations,
     normalize_by_scaling,
 )
-from tqdm import tqdm
-from itertools import product
 
 
 plt.rc("font", **{"family": "sans-serif", "sans-serif": ["Helvetica"]})
@@ -298,35 +290,29 @@ def get_figure_2(
     x, y, s = get_gaussian_data(n_samples=n_samples, plot_data=True)
     # No training so all is test data
     x_test, y_test, s_test = x, y, s
-    model = LinearRegression()
     coefficients = np.arange(-coef_max, coef_max + step / 2, step)
     intercepts = np.arange(-intercept_max, intercept_max + step / 2, step)
-    empirical_ddp = np.zeros((len(coefficients), len(intercepts)))
-    linear_ddp = np.zeros((len(coefficients), len(intercepts)))
-    convex_concave_ddp = np.zeros((len(coefficients), len(intercepts)))
-    lower_ddp = np.zeros((len(coefficients), len(intercepts)))
-    upper_ddp = np.zeros((len(coefficients), len(intercepts)))
-    for coefficient, intercept in tqdm(product(coefficients, intercepts)):
-        model.intercept_ = intercept
-        model.coef_ = np.array([coefficient, -1])
-        y_reg = model.predict(x_test)
-        y_pred = np.array([1 if y > 0 else -1 for y in y_reg])
-        i, j = int((coefficient + coef_max) / step), int(
-            (intercept + intercept_max) / step
-        )
-        ddp, _ = compute_fairness_measures(y_pred, y_test, -s_test)
-        empirical_ddp[i, j] = ddp
-        linear_ddp[i, j] = get_ddp_linear(y_reg, -s_test)
-        convex_concave_ddp[i, j] = get_ddp_convex_concave(y_reg, -s_test)
-        lower_ddp[i, j] = get_ddp_lower(y_reg, -s_test)
-        upper_ddp[i, j] = get_ddp_upper(y_reg, -s_test)
+    # Decision values of the linear models f(x) = coefficient * x_1 - x_2 + intercept
+    # for the whole grid at once, with shape=(coefficients * intercepts, n_samples)
+    y_reg = (
+        coefficients[:, None, None] * x_test[:, 0]
+        - x_test[:, 1]
+        + intercepts[None, :, None]
+    ).reshape(-1, len(x_test))
+    y_pred = np.where(y_reg > 0, 1, -1)
+    grid_shape = (len(coefficients), len(intercepts))
+
+    empirical_ddp, _ = compute_fairness_measures(y_pred, y_test, -s_test)
+    relaxations = get_ddp_relaxations(y_reg, -s_test)
 
     ddp_relaxations = {
-        "DDP": normalize_by_scaling(empirical_ddp),
-        "Linear DDP": normalize_by_scaling(linear_ddp),
-        "Convex-Concave DDP": normalize_by_scaling(convex_concave_ddp),
-        "Lower DDP": normalize_by_scaling(lower_ddp),
-        "Upper DDP": normalize_by_scaling(upper_ddp),
+        "DDP": normalize_by_scaling(empirical_ddp.reshape(grid_shape)),
+        "Linear DDP": normalize_by_scaling(relaxations["linear"].reshape(grid_shape)),
+        "Convex-Concave DDP": normalize_by_scaling(
+            relaxations["convex_concave"].reshape(grid_shape)
+        ),
+        "Lower DDP": normalize_by_scaling(relaxations["lower"].reshape(grid_shape)),
+        "Upper DDP": normalize_by_scaling(relaxations["upper"].reshape(grid_shape)),
     }
     fig, ax = plt.subplots(ncols=5, figsize=(70, 10))
     y, x = np.meshgrid(coefficients, intercepts)
@@ -1,6 +1,12 @@
 #!/usr/bin/env python
 import numpy as np
-from sklearn.metrics import confusion_matrix
+
+# The fairness measures are those of the classifier, so that both always agree
+from searchfair.metrics import (
+    compute_fairness_measures,
+    get_positive_rate,
+    get_true_positive_rate,
+)
 
 
 def print_data_stats(sens_attr, class_labels):
@@ -37,81 +43,29 @@ def print_data_stats(sens_attr, class_labels):
     )
 
 
-def get_positive_rate(y_predicted, y_true):
-    """Compute the positive rate for given predictions of the class label.
+def get_group_weights(sens_attr):
+    """Compute the weight 1 / (n * P(s)) of each point in the relaxations of
+    demographic parity, and the sign that flips the decision values of the
+    protected group.
 
     Parameters
     ----------
-    y_predicted: numpy array
-        The predicted class labels of shape=(number_points,).
-    y_true: numpy array
-        The true class labels of shape=(number_points,).
-
-    Returns
-    ---------
-    pr: float
-        The positive rate.
-    """
-    tn, fp, fn, tp = confusion_matrix(y_true, y_predicted).ravel()
-    pr = (tp + fp) / (tp + fp + tn + fn)
-    return pr
-
-
-def get_true_positive_rate(y_predicted, y_true):
-    """Compute the true positive rate for given predictions of the class label.
-
-    Parameters
-    ----------
-    y_predicted: numpy array
-        The predicted class labels of shape=(number_points,).
-    y_true: numpy array
-        The true class labels of shape=(number_points,).
-
-    Returns
-    ---------
-    tpr: float
-        The true positive rate.
-    """
-    tn, fp, fn, tp = confusion_matrix(y_true, y_predicted).ravel()
-    tpr = tp / (tp + fn)
-    return tpr
-
-
-def compute_fairness_measures(y_predicted, y_true, sens_attr):
-    """Compute value of demographic parity and equality of opportunity for given predictions.
-
-    Parameters
-    ----------
-    y_predicted: numpy array
-        The predicted class labels of shape=(number_points,).
-    y_true: numpy array
-        The true class labels of shape=(number_points,).
     sens_attr: numpy array
         The sensitive labels of shape=(number_points,).
 
     Returns
-    ----------
-    DDP: float
-        The difference of demographic parity.
-    DEO: float
-        The difference of equality of opportunity.
+    ---------
+    weights: numpy array
+        The weights of shape=(number_points,).
+    signs: numpy array
+        1 for the unprotected group and -1 for the protected group, of
+        shape=(number_points,).
     """
-    positive_rate_prot = get_positive_rate(
-        y_predicted[sens_attr == -1], y_true[sens_attr == -1]
-    )
-    positive_rate_unprot = get_positive_rate(
-        y_predicted[sens_attr == 1], y_true[sens_attr == 1]
-    )
-    true_positive_rate_prot = get_true_positive_rate(
-        y_predicted[sens_attr == -1], y_true[sens_attr == -1]
-    )
-    true_positive_rate_unprot = get_true_positive_rate(
-        y_predicted[sens_attr == 1], y_true[sens_attr == 1]
-    )
-    DDP = positive_rate_unprot - positive_rate_prot
-    DEO = true_positive_rate_unprot - true_positive_rate_prot
-
-    return DDP, DEO
+    n = len(sens_attr)
+    p1_hat = (sens_attr == 1).sum() / n
+    weights = np.where(sens_attr == 1.0, 1 / p1_hat, 1 / (1.0 - p1_hat)) / n
+    signs = np.where(sens_attr == 1.0, 1.0, -1.0)
+    return weights, signs
 
 
 def get_ddp_linear(
@@ -123,29 +77,18 @@ def get_ddp_linear(
     Parameters
     ----------
     y_reg: numpy array
-        The value of f on x of shape=(number_points,).
+        The value of f on x of shape=(number_points,), or of
+        shape=(number_models, number_points) for several models at once.
     sens_attr: numpy array
         The sensitive labels of shape=(number_points,).
 
     Returns
     ---------
-    DDP: float
+    DDP: float or numpy array
         The linear relaxation of demographic parity as defined by Donini et al. (2018).
     """
-    n = len(y_reg)
-    p1_hat = (sens_attr == 1).sum() / n
-    return (
-        1
-        / n
-        * np.sum(
-            [
-                sens_attr[i]
-                * y_reg[i]
-                / (p1_hat if sens_attr[i] == 1.0 else 1.0 - p1_hat)
-                for i in range(n)
-            ]
-        )
-    )
+    weights, _ = get_group_weights(sens_attr)
+    return np.asarray(y_reg) @ (sens_attr * weights)
 
 
 def get_ddp_convex_concave(y_reg, sens_attr):
@@ -154,29 +97,20 @@ def get_ddp_convex_concave(y_reg, sens_attr):
     Parameters
     ----------
     y_reg: numpy array
-        The value of f on x of shape=(number_points,).
+        The value of f on x of shape=(number_points,), or of
+        shape=(number_models, number_points) for several models at once.
     sens_attr: numpy array
         The sensitive labels of shape=(number_points,).
 
     Returns
     ---------
-    DDP: float
+    DDP: float or numpy array
         The convex concave relaxation of demographic parity as defined by Zafar et al. (2017a).
     """
-    n = len(y_reg)
+    n = len(sens_attr)
     p1_hat = (sens_attr == 1).sum() / n
-    return (
-        1
-        / n
-        * np.sum(
-            [
-                ((sens_attr[i] + 1 / 2) - p1_hat)
-                * max(0, y_reg[i])
-                / (p1_hat * (1.0 - p1_hat))
-                for i in range(n)
-            ]
-        )
-    )
+    weights = ((sens_attr + 1 / 2) - p1_hat) / (p1_hat * (1.0 - p1_hat)) / n
+    return np.maximum(0, y_reg) @ weights
 
 
 def get_ddp_upper(y_reg, sens_attr):
@@ -185,33 +119,19 @@ def get_ddp_upper(y_reg, sens_attr):
     Parameters
     ----------
     y_reg: numpy array
-        The value of f on x of shape=(number_points,).
+        The value of f on x of shape=(number_points,), or of
+        shape=(number_models, number_points) for several models at once.
     sens_attr: numpy array
         The sensitive labels of shape=(number_points,).
 
     Returns
     ---------
-    DDP: float
+    DDP: float or numpy array
         The upper relaxation of demographic parity as defined by Wu et al. (2019).
     """
-    n = len(y_reg)
-    p1_hat = (sens_attr == 1).sum() / n
-    kappa = lambda x: max(0, 1 + x)
-    return (
-        1
-        / n
-        * np.sum(
-            [
-                (
-                    kappa(y_reg[i]) / p1_hat
-                    if sens_attr[i] == 1.0
-                    else kappa(-y_reg[i]) / (1.0 - p1_hat)
-                )
-                - 1
-                for i in range(n)
-            ]
-        )
-    )
+    weights, signs = get_group_weights(sens_attr)
+    # kappa(x) = max(0, 1 + x)
+    return np.maximum(0, 1 + signs * y_reg) @ weights - 1
 
 
 def get_ddp_lower(y_reg, sens_attr):
@@ -220,33 +140,44 @@ def get_ddp_lower(y_reg, sens_attr):
     Parameters
     ----------
     y_reg: numpy array
-        The value of f on x of shape=(number_points,).
+        The value of f on x of shape=(number_points,), or of
+        shape=(number_models, number_points) for several models at once.
     sens_attr: numpy array
         The sensitive labels of shape=(number_points,).
 
     Returns
     ---------
-    DDP: float
+    DDP: float or numpy array
         The lower relaxation of demographic parity as defined by Wu et al. (2019).
     """
-    n = len(y_reg)
-    p1_hat = (sens_attr == 1).sum() / n
-    delta = lambda x: min(1, x)
-    return (
-        1
-        / n
-        * np.sum(
-            [
-                (
-                    delta(y_reg[i]) / p1_hat
-                    if sens_attr[i] == 1.0
-                    else delta(-y_reg[i]) / (1.0 - p1_hat)
-                )
-                - 1
-                for i in range(n)
-            ]
-        )
-    )
+    weights, signs = get_group_weights(sens_attr)
+    # delta(x) = min(1, x)
+    return np.minimum(1, signs * y_reg) @ weights - 1
+
+
+def get_ddp_relaxations(y_reg, sens_attr):
+    """Compute all relaxations of demographic parity for given predictions.
+
+    Parameters
+    ----------
+    y_reg: numpy array
+        The value of f on x of shape=(number_points,), or of
+        shape=(number_models, number_points) for several models at once.
+    sens_attr: numpy array
+        The sensitive labels of shape=(number_points,).
+
+    Returns
+    ---------
+    relaxations: dict
+        The linear, convex concave, lower and upper relaxations, each a float
+        or an array of shape=(number_models,).
+    """
+    return {
+        "linear": get_ddp_linear(y_reg, sens_attr),
+        "convex_concave": get_ddp_convex_concave(y_reg, sens_attr),
+        "lower": get_ddp_lower(y_reg, sens_attr),
+        "upper": get_ddp_upper(y_reg, sens_attr),
+    }
 
 
 def normalize_by_scaling(matrix: np.array):
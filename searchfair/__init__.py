@@ -1,3 +1,4 @@
 from .classifiers import SearchFair
+from .model_selection import FairSearchCV
 
-__all__ = ['SearchFair']
+__all__ = ['SearchFair', 'FairSearchCV']
@@ -3,11 +3,71 @@ __all__ = ['SearchFair']
 
 from sklearn.model_selection import KFold
 from sklearn.base import BaseEstimator
-import sklearn.metrics.pairwise as kernels
-from sklearn.metrics import confusion_matrix
+from sklearn.kernel_approximation import RBFSampler
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.metrics import pairwise_distances_argmin
+from sklearn.utils import check_random_state
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import numpy as np
+import scipy.sparse as sp
 import cvxpy as cp
+from .kernels import pairwise_kernel, squared_norms
+from .metrics import compute_fairness_measures, get_positive_rate, get_true_positive_rate
+from scipy.optimize import minimize
+from scipy.special import expit
 import random
+import os
+import tempfile
+import time
+try:
+    import resource
+except ImportError: # not available on Windows
+    resource = None
+
+
+def _smooth_pos(z, inner_grad=1.0, mu=1e-3):
+    """Huber smoothing of max(0, z) used by the native solver.
+    Returns the value and the derivative, multiplied by the derivative inner_grad of z.
+    """
+    value = np.where(z <= 0, 0.0, np.where(z < mu, z ** 2 / (2 * mu), z - mu / 2))
+    return value, inner_grad * np.clip(z / mu, 0.0, 1.0)
+
+
+def _peak_memory_mb():
+    """The memory high-water mark of the current process in megabytes, or None if it is not available."""
+    if resource is None:
+        return None
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (2 ** 20 if os.uname().sysname == 'Darwin' else 2 ** 10)
+
+
+# The kernel matrix and the cvxpy problems of the current fit, in each worker process of the parallel search
+_worker_cache = {'kernel_file': None, 'K_sim': None, 'problems': {}}
+
+
+def _learn_in_worker(params, kernel_file, y_train, s_train, reg, bound, solutions):
+    """Solve SearchFair for one lambda in a worker process of the parallel search.
+    The kernel matrix is shared by all workers as a read-only memmap. Sparse matrices are loaded by each worker.
+    Each worker keeps the kernel matrix and the problems of the kernel file it last used, so that the problem
+    of each bound is only built and compiled once per worker, as in the sequential search.
+    """
+    if _worker_cache['kernel_file'] != kernel_file:
+        if kernel_file.endswith('.npz'):
+            K_sim = sp.load_npz(kernel_file)
+        else:
+            K_sim = np.load(kernel_file, mmap_mode='r')
+        _worker_cache.update(kernel_file=kernel_file, K_sim=K_sim, problems={})
+    model = SearchFair(**params)
+    model.y_train = y_train
+    model.s_train = s_train
+    model._preprocess()
+    model.K_sim = _worker_cache['K_sim']
+    model._reset_search_state()
+    model.problems = _worker_cache['problems']
+    model.solutions = solutions
+    model.fairness_bound = bound
+    fair_value, coef = model._learn(reg)
+    return fair_value, coef, model.solve_stats[-1]
 
 
 class SearchFair(BaseEstimator):
@@ -25,8 +85,10 @@ class SearchFair(BaseEstimator):
         Regularization parameter Beta for the l2 regularization.
     kernel: string
         The kind of kernel that is used. It can be 'linear', 'rbf' or 'poly'. For 'rbf' and 'poly', the parameter gamma can be used.
+        With 'precomputed', fit takes the kernel matrix between the training points instead of their features,
+        and predict the kernel matrix between the test points and the training points.
     gamma: float
-        For kernel='rbf', gamma is the kernel width, for kernel='poly', gamma is the degree.
+        For kernel='rbf', gamma is the kernel width, for kernel='poly', gamma is the degree, 3 if None.
     loss_name: string
         The name of the loss used. Possible values: 'hinge', 'logistic', 'squared', 'exponential'
     lambda_max: float
@@ -35,33 +97,158 @@ class SearchFair(BaseEstimator):
         The number of iterations of the solver chosen.
     reason_points: float
         The ratio of points used as reasonable points for the similarity-based approach of SearchFair.
+    reason_point_strategy: string
+        How the reasonable points are chosen. 'first' takes the first points of the training data, 'random' a uniform sample,
+        'stratified' a uniform sample from each group (y, s) in proportion to its size, 'kmeans' the points closest to
+        k-means centroids, and 'leverage' a sample by approximate ridge leverage scores of the kernel matrix.
+    primal: boolean
+        Only for kernel='linear'. If True, the weights w and the bias b of the linear model are optimized directly,
+        instead of one weight per reasonable point. The l2 regularization then applies to (w, b).
+    kernel_approx: string
+        If None, the exact kernel with the reasonable points is used. With 'nystroem', the kernel is factored through
+        n_components landmark points, so that the weights and the stored model scale with n_components instead of the data size.
+        With 'rff', only available for kernel='rbf', the data is mapped to n_components random Fourier features,
+        and the problem is solved in this explicit feature space. Predictions then do not need the training data.
+    n_components: int
+        The rank of the kernel approximation. For 'nystroem', it is the number of landmark points, which replace the reasonable points.
+        For 'rff', it is the number of random Fourier features.
+    random_state: int
+        The seed for the random Fourier features and for the choice of the reasonable points.
+    compact: boolean
+        If True, only the reasonable points and the weights are kept after fit, and the training data,
+        kernel matrix and optimization problems are released.
+    out_of_core: boolean
+        If True, the kernel matrix of fit is computed in blocks of rows that fit in max_memory_mb, and it is written
+        to a scratch file and memory-mapped if it is larger than max_memory_mb. The training data can then be a memmap
+        as well. The native solver reads the memory-mapped kernel matrix one block at a time, so that the memory of fit
+        is bounded by max_memory_mb instead of the size of the kernel matrix. Only available for solver='native'.
+    predict_batch_size: int
+        The number of points for which predict computes the kernel values at once. If None, it follows from max_memory_mb.
+    max_memory_mb: float
+        The memory budget in megabytes of the kernel blocks in predict, and in fit if out_of_core=True.
+    batch_size: int
+        For solver='sgd', the number of points in each mini-batch.
+    learning_rate: float
+        For solver='sgd', the step size of the AdaGrad updates.
+    n_lambdas: int
+        For solver='sgd' and fit_path, the number of nonzero lambdas for each bound, evenly spaced up to lambda_max.
+        For solver='sgd', the models of all lambdas are trained together on the same mini-batches, and the fairest one
+        on held-out points is used.
+    validation_fraction: float
+        For solver='sgd', the share of the points that is held out from training to choose lambda.
+    validation_size: int
+        For solver='sgd', the maximum number of held-out points that are kept. Later points replace them
+        by reservoir sampling, so that they are a uniform sample of all held-out points.
+    dtype: numpy dtype
+        np.float64 or np.float32, the type of the reasonable points, the kernel matrix, the kernel values of predict
+        and the stored weights. np.float32 halves their memory and speeds up predict. The solvers still optimize
+        in float64: cvxpy converts the kernel matrix, and the native and sgd solvers only do the products with it
+        in float32. check_dtype reports the resulting change of accuracy and fairness.
+    callback: function
+        If given, it is called with the record of every problem solved during fit, as soon as it is solved.
+        The records are described in fit_stats_.
     stop_criterion: float
         If SearchFair finds a classifier that is at least as fair as 'stop_criterion', than it stops the search.
     max_search_iter: int
         The number of iterations for the binary search.
+    search_method: string
+        How the next lambda of the search is chosen in the interval where the fairness measure changes its sign.
+        'bisection' takes the middle of the interval. 'illinois' interpolates the fairness values at the ends of the
+        interval linearly (regula falsi), where the value at an end that is kept several times in a row is halved.
+        It falls back to bisection if the interpolated lambda is not inside the interval, or if the interval was not
+        halved by the last two solves. Only available for search_arity=1.
+    search_arity: int
+        The number of lambdas tried in each iteration of the search, evenly spaced in the interval. They can be
+        solved in parallel processes with n_jobs.
+    n_jobs: int
+        The number of processes of the search with search_arity > 1, and of threads in predict.
+        None means 1, and -1 means all processors.
     solver: string
-        The solver that is used by cvxpy. It can be 'SCS' or 'ECOS'.
+        The solver that is used by cvxpy. It can be 'SCS' or 'ECOS'. With 'native', a built-in L-BFGS solver
+        works directly on the kernel matrix without cvxpy, where max(0, z) in the hinge loss and bound is smoothed.
+        With 'sgd', the same smoothed objective is minimized with AdaGrad on mini-batches, and partial_fit can be used
+        for data that arrives in batches. The weights of the fairness regularizer use running estimates of the group
+        proportions. It needs explicit features: primal=True, or kernel_approx='nystroem' or 'rff'. For 'nystroem',
+        the landmarks are a uniform sample of the first batch. max_iter is the number of mini-batches of fit.
+    continuation: boolean
+        If True, each new lambda is warm started from the solution of the nearest lambda solved so far.
+        The primal and dual iterates are reused for 'SCS', the coefficients for 'native'. 'ECOS' does not support warm starts.
+        None means True for 'native' and False for the other solvers: the iterates of another lambda are a poor start
+        for SCS, which needed 10 to 45% more iterations with them on the gaussian data with the linear kernel.
     verbose: boolean
 
     Attributes
     ----------
     coef_: numpy array
-        An array containing the trained weights for each reasonable point.
+        An array containing the trained weights for each reasonable point, for each component of the kernel approximation,
+        or for each feature if primal=True.
+    intercept_: float
+        The bias of the linear model if primal=True, and 0 otherwise.
     reason_pts_index: numpy array
         An array containing the indices of the reasonable points in the training data.
+    reason_pts: numpy array
+        The features of the reasonable points with shape=(number_reasonable_points,number_features).
+    n_iter_: list
+        The tuples (lambda, bound, number of solver iterations) for every problem solved during fit, in order.
+    n_solves_: int
+        The number of problems solved during fit, or the number of models trained together for solver='sgd'.
+    heldout_fairness_: numpy array
+        For solver='sgd', the fairness measure of the model of each lambda on the held-out points.
+    fairness_lambda: float
+        The lambda of the chosen weights, after fit, fit_path or partial_fit.
+    fairness_bound: string
+        The bound 'upper' or 'lower' of the fairness constraint of the chosen weights.
+    fit_stats_: dict
+        Timings of the last fit. 'phases' maps the phases 'preprocess', 'reason_points', 'kernel', 'search' and 'total'
+        to their wall time in seconds, and 'construct', 'compile', 'solve' and 'fairness' to the sum of the times of all solves.
+        'solves' lists one record per problem solved, in order, with the keys 'lambda', 'bound', 'status', 'n_iter',
+        'construct_time' (building the cvxpy problem, 0 if it is reused), 'compile_time' (canonicalization by cvxpy),
+        'solve_time', 'fairness_time' (evaluating the fairness on the training data), 'total_time', 'fairness'
+        and 'peak_memory_mb', the memory high-water mark of the process that solved it.
+        In a parallel search, the solves run in worker processes, and their times overlap.
+    path_lambdas_: numpy array
+        After fit_path, the lambdas of the path, with shape=(number_models,).
+    path_bounds_: numpy array
+        After fit_path, the bound 'upper' or 'lower' of each model of the path.
+    path_coefs_: numpy array
+        After fit_path, the weights of the models of the path with shape=(number_weights,number_models).
+    path_accuracy_, path_DDP_, path_DEO_: numpy array
+        After fit_path, the accuracy and the fairness measures of each model of the path on the training data.
+    path_index_: int
+        After fit_path, the index of the model of the path chosen by select_path.
 
     Notes
     ----------
 
     """
 
-    def __init__(self, fairness_notion='DDP', fairness_regularizer='wu', wu_bound='hinge', reg_beta=0.001, kernel='linear', gamma=None, loss_name='hinge', lambda_max=1, max_iter=3000, reason_points=0.5, stop_criterion=0.01, max_search_iter=10, solver='SCS', verbose=False):
+    def __init__(self, fairness_notion='DDP', fairness_regularizer='wu', wu_bound='hinge', reg_beta=0.001, kernel='linear', gamma=None, loss_name='hinge', lambda_max=1, max_iter=3000, reason_points=0.5, stop_criterion=0.01, max_search_iter=10, solver='SCS', continuation=None, n_jobs=None, search_arity=1, search_method='bisection', reason_point_strategy='first', primal=False, kernel_approx=None, n_components=100, random_state=None, compact=True, out_of_core=False, predict_batch_size=None, max_memory_mb=256, batch_size=256, learning_rate=0.1, n_lambdas=10, validation_fraction=0.1, validation_size=10000, dtype=np.float64, callback=None, verbose=False):
 
         self.reg_beta = reg_beta
         self.fairness_notion = fairness_notion
         self.max_iter = max_iter
         self.max_search_iter = max_search_iter
         self.solver = solver
+        self.continuation = continuation
+        self.n_jobs = n_jobs
+        self.search_arity = search_arity
+        self.search_method = search_method
+        self.reason_point_strategy = reason_point_strategy
+        self.primal = primal
+        self.kernel_approx = kernel_approx
+        self.n_components = n_components
+        self.random_state = random_state
+        self.compact = compact
+        self.out_of_core = out_of_core
+        self.predict_batch_size = predict_batch_size
+        self.max_memory_mb = max_memory_mb
+        self.batch_size = batch_size
+        self.learning_rate = learning_rate
+        self.n_lambdas = n_lambdas
+        self.dtype = dtype
+        self.validation_fraction = validation_fraction
+        self.validation_size = validation_size
+        self.callback = callback
         self.verbose = verbose
         self.stop_criterion = stop_criterion
         self.reason_points = reason_points
@@ -78,7 +265,7 @@ class SearchFair(BaseEstimator):
 
         Parameters
         ----------
-        x_train: numpy array
+        x_train: numpy array or scipy sparse matrix
             The features of the training data with shape=(number_points,number_features).
         y_train: numpy array
             The class labels of the training data with shape=(number_points,).
@@ -89,46 +276,31 @@ class SearchFair(BaseEstimator):
         ----------
         self: object
         """
+        if self.solver == 'sgd':
+            return self._fit_sgd(x_train, y_train, s_train)
 
-        self.x_train = x_train
-        self.y_train = y_train
-        self.s_train = s_train
-
-        if self.verbose:
-            print("Preprocessing...")
-        self._preprocess()
+        fit_start = time.perf_counter()
+        phases = self._setup_fit(x_train, y_train, s_train)
+        search_start = time.perf_counter()
+        self._reset_search_state()
 
         lbda_min, lbda_max = 0, self.lambda_max
-
-        def learn(reg, bound='upper'):
-            # If bound is None, we have decided which one to use, and we are in the middle of the binary search
-
-            self.fairness_lambda = reg
-            if bound is not None:
-                self._construct_problem(bound=bound)
-            self._optimize()
-            DDP, DEO = self.compute_fairness_measures(self.predict(x_train), y_train, s_train)
-            if self.fairness_notion == 'DDP':
-                fair_value = DDP
-            else:
-                fair_value = DEO
-            if self.verbose: print("Obtained:",self.fairness_notion, "= %0.4f with lambda = %0.4f" % (fair_value, reg))
-            return fair_value, self.coef_.copy()
-
         criterion = False
 
         bound = 'upper' # even though an upper bound is specified, since lambda_min is 0, it falls away
         if self.verbose: print("Testing lambda_min: %0.2f" % lbda_min)
-        min_fair_measure, min_alpha = learn(lbda_min, bound=bound)
+        min_fair_measure, min_alpha = self._learn(lbda_min, bound=bound)
         if np.sign(min_fair_measure) < 0: bound = 'lower'
         if self.verbose: print("Testing lambda_max: %0.2f" % lbda_max)
-        max_fair_measure, max_alpha = learn(lbda_max, bound)
+        max_fair_measure, max_alpha = self._learn(lbda_max, bound)
 
         if np.abs(min_fair_measure) < np.abs(max_fair_measure):
             best_lbda, best_fair_measure = lbda_min, min_fair_measure
+            best_bound = 'upper'
             best_alpha = min_alpha
         else:
             best_lbda, best_fair_measure = lbda_max, max_fair_measure
+            best_bound = bound
             best_alpha = max_alpha
         if  np.abs(best_fair_measure) < self.stop_criterion:
             print("Classifier is fair enough with lambda = {:.4f}".format(best_lbda))
@@ -137,46 +309,617 @@ class SearchFair(BaseEstimator):
             print('Either try a different fairness regularizer or change the values of lambda_min and lambda_max') # Possibly, there could be a few more tries by reducing lambda.
         else:
             search_iter = 0
+            # The widths of the interval, and which end was kept in each iteration
+            widths = [lbda_max - lbda_min]
+            kept_ends = []
             if self.verbose: print("Starting Binary Search...")
-            while not criterion and search_iter < self.max_search_iter:
-                lbda_new = (lbda_min + lbda_max) / 2
-
-                if self.verbose:
-                    print(10*'-'+"Iteration #%0.0f" % search_iter + 10*'-')
-                    print("Testing new Lambda: %0.4f" % lbda_new)
-
-                new_rd, new_alpha = learn(lbda_new, None)
-                if np.abs(new_rd) < np.abs(best_fair_measure):
-                    best_fair_measure = new_rd
-                    best_lbda = lbda_new
-                    best_alpha = new_alpha.copy()
-
-                if np.sign(new_rd) == np.sign(min_fair_measure):
-                    min_fair_measure = new_rd
-                    lbda_min = lbda_new
-                else:
-                    max_fair_measure = new_rd
-                    lbda_max = lbda_new
-                if np.abs(new_rd) < self.stop_criterion:
-                    criterion = True
-
-                search_iter += 1
+            executor, kernel_dir = self._start_workers()
+            try:
+                while not criterion and search_iter < self.max_search_iter:
+                    lbdas_new = self._next_lambdas(lbda_min, lbda_max, min_fair_measure, max_fair_measure,
+                                                   widths, kept_ends)
+
+                    if self.verbose:
+                        print(10*'-'+"Iteration #%0.0f" % search_iter + 10*'-')
+                        print("Testing new Lambda: " + ", ".join("%0.4f" % lbda_new for lbda_new in lbdas_new))
+
+                    results = self._learn_many(lbdas_new, executor, kernel_dir)
+                    for lbda_new, (new_rd, new_alpha) in zip(lbdas_new, results):
+                        if np.abs(new_rd) < np.abs(best_fair_measure):
+                            best_fair_measure = new_rd
+                            best_lbda = lbda_new
+                            best_bound = bound
+                            best_alpha = new_alpha.copy()
+                        if np.abs(new_rd) < self.stop_criterion:
+                            criterion = True
+
+                    # Keep the first sub-interval in which the fairness measure changes its sign
+                    for lbda_new, (new_rd, new_alpha) in zip(lbdas_new, results):
+                        if np.sign(new_rd) == np.sign(min_fair_measure):
+                            min_fair_measure = new_rd
+                            lbda_min = lbda_new
+                            kept_ends.append('max')
+                        else:
+                            max_fair_measure = new_rd
+                            lbda_max = lbda_new
+                            kept_ends.append('min')
+                            break
+                    widths.append(lbda_max - lbda_min)
+
+                    search_iter += 1
+            finally:
+                if executor is not None:
+                    executor.shutdown()
+                if kernel_dir is not None:
+                    kernel_dir.cleanup()
             if search_iter==self.max_search_iter and self.verbose:
                 print("Hit maximum iterations of Binary Search.")
             elif self.verbose:
                 print("Sufficient fairness obtained before maximum iterations were reached.")
 
-        if self.verbose: print(10*'-'+"Found Lambda %0.4f with fairness %0.4f" % (best_lbda, best_fair_measure)+10*'-')
-        self.coef_ = best_alpha.copy()
+        phases['search'] = time.perf_counter() - search_start
+        self._set_fit_stats(phases, fit_start)
+
+        if self.verbose and len(self.compilation_times) > 0:
+            # Without DPP, every solve would pay the cost of the first canonicalization
+            total_time = sum(self.compilation_times)
+            print("Canonicalization: %0.2fs for %d solves (%0.2fs saved by reusing %d compiled problems)"
+                  % (total_time, len(self.compilation_times),
+                     max(self.compilation_times) * len(self.compilation_times) - total_time, len(self.problems)))
+        if self.verbose: print(10*'-'+"Found Lambda %0.4f with fairness %0.4f after %d solves" % (best_lbda, best_fair_measure, self.n_solves_)+10*'-')
+        # The lambda and bound of the chosen weights, instead of the last ones solved
+        self.fairness_lambda, self.fairness_bound = best_lbda, best_bound
+        self.coef_ = best_alpha.astype(self._dtype())
+        self.intercept_ = 0.0
+        if self.primal:
+            self.coef_, self.intercept_ = self.coef_[:-1], best_alpha[-1]
+        if self.compact:
+            self._compact()
+
+        return self
+
+    def fit_path(self, x_train, y_train, s_train=None):
+        """Solves the problem for a grid of lambdas and both bounds, and keeps the weights of all of them, so that
+        a model for any fairness target or notion can be chosen afterwards with select_path, without solving again.
+        The grid is lambda 0 and n_lambdas values evenly spaced up to lambda_max for each bound. With n_jobs > 1,
+        the lambdas of each bound are solved in parallel processes, and are only warm started from lambda 0.
+        Otherwise, each lambda is warm started from the previous one if continuation is on.
+        The model of select_path() is used by predict.
+
+        Parameters
+        ----------
+        x_train: numpy array or scipy sparse matrix
+            The features of the training data with shape=(number_points,number_features).
+        y_train: numpy array
+            The class labels of the training data with shape=(number_points,).
+        s_train: numpy array
+            The binary sensitive attributes of the training data with shape=(number_points,).
+
+        Returns
+        ----------
+        self: object
+        """
+        if self.solver == 'sgd':
+            raise ValueError("fit_path is not available for solver='sgd', whose fit already trains a grid of lambdas.")
+
+        fit_start = time.perf_counter()
+        phases = self._setup_fit(x_train, y_train, s_train)
+        search_start = time.perf_counter()
+        self._reset_search_state()
+
+        grid = self.lambda_max * np.arange(1, self.n_lambdas + 1) / self.n_lambdas
+        self.path_lambdas_ = np.concatenate([[0.0], grid, grid])
+        self.path_bounds_ = np.array(['upper'] + ['upper'] * self.n_lambdas + ['lower'] * self.n_lambdas)
+        if self.verbose: print("Solving the path of %d lambdas..." % len(self.path_lambdas_))
+        coefs = [self._learn(0.0, bound='upper')[1]]
+        executor, kernel_dir = self._start_workers(self._effective_n_jobs())
+        try:
+            for bound in ['upper', 'lower']:
+                self.fairness_bound = bound
+                coefs.extend(coef for fair_value, coef in self._learn_many(grid, executor, kernel_dir))
+        finally:
+            if executor is not None:
+                executor.shutdown()
+            if kernel_dir is not None:
+                kernel_dir.cleanup()
+        self.path_coefs_ = np.column_stack(coefs).astype(self._dtype())
+
+        # The measures of all models on the training data, from one pass over the kernel matrix
+        y_hat = np.concatenate([kernel_block @ self.path_coefs_ for rows, kernel_block in self._kernel_blocks()])
+        y_predicted = np.sign(y_hat).T
+        self.path_accuracy_ = np.mean(y_predicted == self.y_train.ravel(), axis=1)
+        self.path_DDP_, self.path_DEO_ = self.compute_fairness_measures(y_predicted, self.y_train, self.s_train)
+
+        phases['search'] = time.perf_counter() - search_start
+        self._set_fit_stats(phases, fit_start)
+        self.select_path()
+        if self.compact:
+            self._compact()
+        return self
+
+    def select_path(self, fairness_target=None, fairness_notion=None):
+        """Use the model of the path of fit_path that is the most accurate on the training data among those
+        whose absolute fairness measure is at most fairness_target. If there are none, or fairness_target is None,
+        the fairest model is used. Among equally good models, the one with the smallest lambda is used.
+        The models of the path were all trained with the regularizer of the fairness_notion of the estimator,
+        but they can be chosen by either notion.
+
+        Parameters
+        ----------
+        fairness_target: float
+            The largest accepted absolute fairness measure on the training data.
+        fairness_notion: string
+            'DDP' or 'DEO'. If None, the fairness_notion of the estimator is used.
+
+        Returns
+        ----------
+        self: object
+        """
+        fairness_notion = self.fairness_notion if fairness_notion is None else fairness_notion
+        if fairness_notion not in ['DDP', 'DEO']:
+            raise ValueError("fairness_notion has to be 'DDP' or 'DEO'.")
+        fairness = np.abs(self.path_DDP_ if fairness_notion == 'DDP' else self.path_DEO_)
+        fairness = np.nan_to_num(fairness, nan=np.inf)
+        feasible = np.zeros(len(fairness), dtype=bool) if fairness_target is None else fairness <= fairness_target
+        if np.any(feasible):
+            best = np.lexsort((self.path_lambdas_, -self.path_accuracy_, ~feasible))[0]
+        else:
+            best = np.lexsort((self.path_lambdas_, fairness))[0]
+
+        self.path_index_ = best
+        self.fairness_lambda = self.path_lambdas_[best]
+        self.fairness_bound = self.path_bounds_[best]
+        self.coef_, self.intercept_ = self.path_coefs_[:, best].copy(), 0.0
+        if self.primal:
+            self.coef_, self.intercept_ = self.coef_[:-1], self.coef_[-1]
+        if self.verbose:
+            print("Selected lambda %0.4f (%s bound) with %s %0.4f and training accuracy %0.4f"
+                  % (self.fairness_lambda, self.fairness_bound, fairness_notion, fairness[best], self.path_accuracy_[best]))
+        return self
+
+    def _setup_fit(self, x_train, y_train, s_train):
+        """Prepare the search of fit and fit_path: the weights of the fairness constraint, the reasonable points
+        and the kernel matrix.
+
+        Returns
+        ----------
+        phases: dict
+            The wall times of the phases 'preprocess', 'reason_points' and 'kernel' in seconds.
+        """
+        phases = {}
+
+        # Sparse data is sliced by rows, for the reasonable points and in the blocks of predict
+        self.x_train = x_train.tocsr() if sp.issparse(x_train) else x_train
+        self.y_train = y_train
+        self.s_train = s_train
+
+        if self.search_method not in ['bisection', 'illinois']:
+            raise ValueError("search_method has to be 'bisection' or 'illinois'.")
+        if self.search_method != 'bisection' and self.search_arity != 1:
+            raise ValueError("search_method='%s' is only available for search_arity=1." % self.search_method)
+        if self.out_of_core and self.solver != 'native':
+            raise ValueError("out_of_core=True is only available for solver='native'.")
+
+        if self.verbose:
+            print("Preprocessing...")
+        start = time.perf_counter()
+        self._preprocess()
+        phases['preprocess'] = time.perf_counter() - start
+        start = time.perf_counter()
+        self._select_reason_points()
+        self.reason_pts = self.x_train[self.reason_pts_index].astype(self._dtype(), copy=False)
+        if self.kernel == 'precomputed':
+            # Only the kernel values between the reasonable points are kept, instead of their rows of the kernel matrix
+            self.reason_pts = self.reason_pts[:, self.reason_pts_index]
+        # The norms of the reasonable points are needed by every rbf kernel with them, in fit and predict
+        self.reason_pts_sq_norms = squared_norms(self.reason_pts) if self.kernel == 'rbf' else None
+        phases['reason_points'] = time.perf_counter() - start
+
+        # The kernel matrix only depends on the training data, so it is computed once per fit
+        # and shared by all problems solved during the search.
+        if self.verbose:
+            print("Computing kernel matrix...")
+        start = time.perf_counter()
+        self._setup_features(self.x_train)
+        self.K_sim = self._kernel_matrix(self.x_train)
+        phases['kernel'] = time.perf_counter() - start
+        return phases
+
+    def _set_fit_stats(self, phases, fit_start):
+        """Sum the times of the solves into the phases, and set n_solves_ and fit_stats_."""
+        self.n_solves_ = len(self.n_iter_)
+        for phase in ['construct', 'compile', 'solve', 'fairness']:
+            phases[phase] = sum(record[phase + '_time'] for record in self.solve_stats)
+        phases['total'] = time.perf_counter() - fit_start
+        self.fit_stats_ = {'phases': phases, 'solves': self.solve_stats}
+
+    def partial_fit(self, x, y, s):
+        """Continue the training of solver='sgd' with a batch of data. The first call prepares the features from the batch.
+        A share validation_fraction of the points is held out to choose lambda, and the models are trained on mini-batches
+        of the others.
 
+        Parameters
+        ----------
+        x: numpy array or scipy sparse matrix
+            The features of the batch with shape=(number_points,number_features).
+        y: numpy array
+            The class labels of the batch with shape=(number_points,).
+        s: numpy array
+            The binary sensitive attributes of the batch with shape=(number_points,).
+
+        Returns
+        ----------
+        self: object
+        """
+        if self.solver != 'sgd':
+            raise ValueError("partial_fit is only available for solver='sgd'.")
+        x = x.tocsr() if sp.issparse(x) else x
+        if getattr(self, 'sgd_coefs', None) is None:
+            self._init_sgd(x)
+        self._set_functions()
+
+        heldout = self.sgd_random_state.random_sample(len(y)) < self.validation_fraction
+        self._add_heldout(x[heldout], y[heldout], s[heldout])
+        train_index = np.flatnonzero(~heldout)
+        for start in range(0, len(train_index), self.batch_size):
+            batch = train_index[start:start + self.batch_size]
+            self._sgd_step(x[batch], y[batch], s[batch])
+        self._select_sgd_model(x[train_index], y[train_index], s[train_index])
+        if self.compact:
+            self._compact()
         return self
 
+    def _fit_sgd(self, x_train, y_train, s_train):
+        """Fit with solver='sgd'. A share validation_fraction of the training data is held out to choose lambda,
+        and the models of all lambdas are trained on max_iter mini-batches of the rest, in shuffled passes.
+        """
+        fit_start = time.perf_counter()
+        x_train = x_train.tocsr() if sp.issparse(x_train) else x_train
+        self.sgd_random_state = check_random_state(self.random_state)
+        heldout = self.sgd_random_state.random_sample(len(y_train)) < self.validation_fraction
+        train_index = np.flatnonzero(~heldout)
+        if len(train_index) == 0:
+            raise ValueError("No training points are left after holding out validation_fraction of the data.")
+
+        if self.verbose:
+            print("Computing features...")
+        self._init_sgd(x_train[train_index])
+        kernel_time = time.perf_counter() - fit_start
+        self._add_heldout(x_train[heldout], y_train[heldout], s_train[heldout])
+
+        if self.verbose:
+            print("Training %d models on %d mini-batches..." % (len(self.sgd_lambdas), self.max_iter))
+        search_start = time.perf_counter()
+        while self.nmb_sgd_steps < self.max_iter:
+            order = self.sgd_random_state.permutation(train_index)
+            for start in range(0, len(order), self.batch_size):
+                if self.nmb_sgd_steps == self.max_iter:
+                    break
+                batch = order[start:start + self.batch_size]
+                self._sgd_step(x_train[batch], y_train[batch], s_train[batch])
+        self._select_sgd_model(x_train[train_index], y_train[train_index], s_train[train_index])
+
+        bounds = ['upper' if sign > 0 else 'lower' for sign in self.sgd_bound_signs]
+        self.n_iter_ = [(lbda, bound, self.nmb_sgd_steps) for lbda, bound in zip(self.sgd_lambdas, bounds)]
+        self.n_solves_ = len(self.n_iter_)
+        self.fit_stats_ = {'phases': {'kernel': kernel_time, 'search': time.perf_counter() - search_start,
+                                      'total': time.perf_counter() - fit_start},
+                           'solves': [{'lambda': lbda, 'bound': bound, 'n_iter': self.nmb_sgd_steps, 'fairness': float(fairness)}
+                                      for lbda, bound, fairness in zip(self.sgd_lambdas, bounds, self.heldout_fairness_)]}
+        if self.verbose: print(10*'-'+"Found Lambda %0.4f (%s bound) with held-out fairness %0.4f" % (self.fairness_lambda, self.fairness_bound, np.min(np.abs(self.heldout_fairness_)))+10*'-')
+        if self.compact:
+            self._compact()
+        return self
+
+    def _init_sgd(self, x):
+        """Prepare the feature map and the state of solver='sgd' from the first points."""
+        if not self.primal and self.kernel_approx not in ['nystroem', 'rff']:
+            raise ValueError("solver='sgd' needs explicit features: primal=True, or kernel_approx='nystroem' or 'rff'.")
+        if getattr(self, 'sgd_random_state', None) is None:
+            self.sgd_random_state = check_random_state(self.random_state)
+        self._set_functions()
+
+        self.reason_pts = x[:0].astype(self._dtype(), copy=False)
+        if not self.primal and self.kernel_approx == 'nystroem':
+            landmarks = self.sgd_random_state.choice(x.shape[0], min(self.n_components, x.shape[0]), replace=False)
+            self.reason_pts = x[np.sort(landmarks)].astype(self._dtype(), copy=False)
+            self.reason_pts_sq_norms = squared_norms(self.reason_pts) if self.kernel == 'rbf' else None
+        self._setup_features(x)
+
+        # Lambda 0, then n_lambdas values for the upper and for the lower bound
+        grid = self.lambda_max * np.arange(1, self.n_lambdas + 1) / self.n_lambdas
+        self.sgd_lambdas = np.concatenate([[0.0], grid, grid])
+        self.sgd_bound_signs = np.concatenate([[1.0], np.ones(self.n_lambdas), -np.ones(self.n_lambdas)])
+        nmb_coefs = self._design_matrix(x[:1]).shape[1]
+        self.sgd_coefs = np.zeros((nmb_coefs, len(self.sgd_lambdas)))
+        self.sgd_grad_sq = np.zeros_like(self.sgd_coefs)
+        self.nmb_sgd_steps = 0
+        # The number of training points seen in each group (s, y), as in compute_fairness_measures
+        self.group_counts = np.zeros(4)
+        self.heldout_features = None
+        self.heldout_y = np.empty(0)
+        self.heldout_s = np.empty(0)
+        self.nmb_heldout_seen = 0
+
+    def _sgd_step(self, x, y, s):
+        """One AdaGrad step of the models of all lambdas on a mini-batch."""
+        if len(y) == 0:
+            return
+        features = self._design_matrix(x)
+        groups = 2 * (s == 1) + (y == 1)
+        self.group_counts += np.bincount(groups, minlength=4)
+
+        # Running estimates of the group proportions replace the fixed weight_vector of fit
+        group_probs = np.maximum(self.group_counts, 1) / np.sum(self.group_counts)
+        if self.fairness_notion == 'DDP':
+            weights = 1.0 / np.repeat(group_probs[0::2] + group_probs[1::2], 2)[groups]
+        else:
+            weights = (y == 1) / group_probs[groups]
+
+        with np.errstate(over='ignore'):
+            # The products with the features are done in dtype, and the rest in float64
+            y_hat = np.asarray(features @ self.sgd_coefs.astype(features.dtype, copy=False)).astype(np.float64, copy=False)
+            loss, loss_grad = self.native_loss(y[:, None] * y_hat)
+            y_hat_grad = y[:, None] * loss_grad
+            if self.fairness_regularizer == 'wu':
+                signs = self.sgd_bound_signs * s[:, None]
+                kappa, kappa_grad = self.native_kappa(signs * y_hat)
+                y_hat_grad += self.sgd_lambdas * signs * weights[:, None] * kappa_grad
+            elif self.fairness_regularizer == 'linear':
+                y_hat_grad += self.sgd_lambdas * self.sgd_bound_signs * weights[:, None]
+        grad = features.T @ (y_hat_grad / len(y)).astype(features.dtype, copy=False) + 2 * self.reg_beta * self.sgd_coefs
+
+        # AdaGrad adapts the step size to the scale of each feature
+        self.sgd_grad_sq += grad ** 2
+        self.sgd_coefs -= self.learning_rate * grad / (np.sqrt(self.sgd_grad_sq) + 1e-8)
+        self.nmb_sgd_steps += 1
+
+    def _add_heldout(self, x, y, s):
+        """Add points to the held-out sample of solver='sgd', with reservoir sampling once it holds validation_size points."""
+        if len(y) == 0:
+            return
+        features = self._design_matrix(x)
+        nmb_fill = max(0, min(self.validation_size - len(self.heldout_y), len(y)))
+        if nmb_fill > 0:
+            if self.heldout_features is None:
+                self.heldout_features = features[:nmb_fill]
+            elif sp.issparse(features):
+                self.heldout_features = sp.vstack([self.heldout_features, features[:nmb_fill]], format='csr')
+            else:
+                self.heldout_features = np.vstack([self.heldout_features, features[:nmb_fill]])
+            self.heldout_y = np.concatenate([self.heldout_y, y[:nmb_fill]])
+            self.heldout_s = np.concatenate([self.heldout_s, s[:nmb_fill]])
+
+        # Every later point t replaces a random slot j <= t, if j < validation_size
+        rows = np.arange(nmb_fill, len(y))
+        slots = np.floor(self.sgd_random_state.random_sample(len(rows)) * (self.nmb_heldout_seen + rows + 1)).astype(int)
+        rows, slots = rows[slots < self.validation_size], slots[slots < self.validation_size]
+        slots, last = np.unique(slots[::-1], return_index=True)
+        rows = rows[::-1][last]
+        if len(rows) > 0:
+            if sp.issparse(features):
+                heldout_features = self.heldout_features.tolil()
+                heldout_features[slots] = features[rows]
+                self.heldout_features = heldout_features.tocsr()
+            else:
+                self.heldout_features[slots] = features[rows]
+            self.heldout_y[slots] = y[rows]
+            self.heldout_s[slots] = s[rows]
+        self.nmb_heldout_seen += len(y)
+
+    def _select_sgd_model(self, x, y, s):
+        """Use the model of the lambda that is the fairest on the held-out points, or on the given points if none
+        are held out. Among equally fair models, the one with the smallest lambda is used.
+        """
+        if len(self.heldout_y) > 0:
+            features, y, s = self.heldout_features, self.heldout_y, self.heldout_s
+        else:
+            features = self._design_matrix(x)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            DDP, DEO = self.compute_fairness_measures(np.sign(np.asarray(features @ self.sgd_coefs.astype(features.dtype, copy=False))).T, y, s)
+        self.heldout_fairness_ = DDP if self.fairness_notion == 'DDP' else DEO
+        best = np.lexsort((self.sgd_lambdas, np.nan_to_num(np.abs(self.heldout_fairness_), nan=np.inf)))[0]
+
+        self.fairness_lambda = self.sgd_lambdas[best]
+        self.fairness_bound = 'upper' if self.sgd_bound_signs[best] > 0 else 'lower'
+        self.coef_, self.intercept_ = self.sgd_coefs[:, best].astype(self._dtype()), 0.0
+        if self.primal:
+            self.coef_, self.intercept_ = self.coef_[:-1], self.coef_[-1]
+
+    def _next_lambdas(self, lbda_min, lbda_max, min_fair_measure, max_fair_measure, widths, kept_ends):
+        """Choose the next lambdas of the search with search_method.
+
+        Parameters
+        ----------
+        lbda_min, lbda_max: float
+            The ends of the interval in which the fairness measure changes its sign.
+        min_fair_measure, max_fair_measure: float
+            The fairness measures at lbda_min and lbda_max.
+        widths: list
+            The width of the interval after each iteration of the search, starting with the initial one.
+        kept_ends: list
+            Which end of the interval, 'min' or 'max', was kept in each iteration of the search.
+
+        Returns
+        ----------
+        lbdas_new: numpy array
+            The lambdas to solve next.
+        """
+        width = lbda_max - lbda_min
+        # With search_arity = 1, this is the middle of the interval as in a binary search
+        bisection = lbda_min + width * np.arange(1, self.search_arity + 1) / (self.search_arity + 1)
+        # The interval has to be at least halved by every two solves, so that the search is never slower than
+        # half the speed of bisection
+        if self.search_method == 'bisection' or (len(widths) > 2 and width > widths[-3] / 2):
+            return bisection
+
+        # The value at an end that is kept again is halved, so that the other end moves
+        f_min, f_max = min_fair_measure, max_fair_measure
+        nmb_kept = 0
+        for end in reversed(kept_ends):
+            if end != kept_ends[-1]:
+                break
+            nmb_kept += 1
+        if nmb_kept > 1 and kept_ends[-1] == 'min':
+            f_min *= 0.5 ** (nmb_kept - 1)
+        elif nmb_kept > 1:
+            f_max *= 0.5 ** (nmb_kept - 1)
+        lbda_new = (lbda_min * f_max - lbda_max * f_min) / (f_max - f_min)
+
+        # Lambdas at the ends would not shrink the interval
+        margin = 1e-3 * width
+        if not lbda_min + margin < lbda_new < lbda_max - margin:
+            return bisection
+        return np.array([lbda_new])
+
+    def _compact(self):
+        """Release everything that predict does not need: the training data, the kernel matrix,
+        the cvxpy problems and the functions built in _preprocess. This also makes the model picklable.
+        """
+        for attribute in ['x_train', 'y_train', 's_train', 'K_sim', 'weight_vector', 'problems', 'solutions',
+                          'prob', 'alpha_var', 'fair_reg_cparam', 'reg_beta_cparam', 'problem_cache', 'loss_func', 'native_loss', 'cvx_kappa',
+                          'cvx_delta', 'native_kappa', 'solve_stats', 'solve_record']:
+            if hasattr(self, attribute):
+                delattr(self, attribute)
+        if hasattr(self, 'scratch_dir'):
+            self.scratch_dir.cleanup()
+            del self.scratch_dir
+
+    def _reset_search_state(self):
+        """Forget the problems and solutions of a previous search. If the attribute problem_cache is set, as by
+        FairSearchCV, the cvxpy problems and the solutions are taken from and stored in this dict instead, so that
+        models fitted on the same data share them, and are warm started from each other. They are only shared by
+        models with the same reasonable points, since the kernel matrix is a constant of the problems.
+        """
+        problem_cache = getattr(self, 'problem_cache', None)
+        if problem_cache is None:
+            self.problems = {}
+            self.solutions = []
+        else:
+            shared = problem_cache.setdefault(self.reason_pts_index.tobytes(), {'problems': {}, 'solutions': []})
+            self.problems = shared['problems']
+            self.solutions = shared['solutions']
+        self.n_iter_ = []
+        self.compilation_times = []
+        self.solve_stats = []
+
+    def _learn(self, reg, bound=None):
+        """Solve the problem for one value of lambda, and compute the fairness of the solution on the training data.
+        If bound is None, we have decided which one to use, and we are in the middle of the binary search.
+
+        Returns
+        ----------
+        fair_value: float
+            The value of the chosen fairness notion.
+        coef: numpy array
+            The trained weights.
+        """
+        start = time.perf_counter()
+        self.fairness_lambda = reg
+        if bound is not None:
+            self.fairness_bound = bound
+        # _optimize fills in the solver part of the record
+        self.solve_record = {'lambda': reg, 'bound': self.fairness_bound, 'construct_time': 0.0, 'compile_time': 0.0}
+        self._optimize()
+        fairness_start = time.perf_counter()
+        fair_value = self._fairness_value(self.coef_)
+        self.solve_record.update(fairness_time=time.perf_counter() - fairness_start,
+                                 total_time=time.perf_counter() - start,
+                                 fairness=float(fair_value), n_iter=self.n_iter_[-1][2],
+                                 peak_memory_mb=_peak_memory_mb())
+        self._record_solve(self.solve_record)
+        if self.verbose: print("Obtained:",self.fairness_notion, "= %0.4f with lambda = %0.4f (%s solver iterations)" % (fair_value, reg, self.n_iter_[-1][2]))
+        return fair_value, self.coef_.copy()
+
+    def _record_solve(self, record):
+        """Store the record of a solve, and pass it to the callback."""
+        self.solve_stats.append(record)
+        if self.callback is not None:
+            self.callback(record)
+
+    def _fairness_value(self, coef):
+        """Compute the chosen fairness notion on the training data for the given weights."""
+        coef = coef.astype(self.K_sim.dtype, copy=False)
+        y_hat = np.concatenate([kernel_block @ coef for rows, kernel_block in self._kernel_blocks()])
+        DDP, DEO = self.compute_fairness_measures(np.sign(y_hat), self.y_train, self.s_train)
+        if self.fairness_notion == 'DDP':
+            return DDP
+        else:
+            return DEO
+
+    def _start_workers(self, max_workers=None):
+        """Start the process pool of the parallel search, and write the kernel matrix to a memmapped file
+        that all workers share.
+
+        Parameters
+        ----------
+        max_workers: int
+            The number of processes. If None, it is the number of lambdas of each iteration of the search,
+            search_arity, at most n_jobs.
+
+        Returns
+        ----------
+        executor: ProcessPoolExecutor
+            The process pool, or None if the search is not parallel.
+        kernel_dir: TemporaryDirectory
+            The directory containing the kernel matrix, or None if the search is not parallel
+            or the kernel matrix is already memory-mapped.
+        """
+        if max_workers is None:
+            max_workers = min(self._effective_n_jobs(), self.search_arity)
+        if max_workers == 1:
+            return None, None
+        executor = ProcessPoolExecutor(max_workers=max_workers)
+        if isinstance(self.K_sim, np.memmap):
+            # The kernel matrix of out_of_core=True is already in a file
+            return executor, None
+        kernel_dir = tempfile.TemporaryDirectory()
+        if sp.issparse(self.K_sim):
+            sp.save_npz(os.path.join(kernel_dir.name, 'kernel.npz'), self.K_sim)
+        else:
+            np.save(os.path.join(kernel_dir.name, 'kernel.npy'), self.K_sim)
+        return executor, kernel_dir
+
+    def _learn_many(self, lbdas, executor=None, kernel_dir=None):
+        """Solve the problem for several values of lambda, in parallel if an executor is given.
+
+        Returns
+        ----------
+        results: list
+            The tuples (fair_value, coef) for each lambda.
+        """
+        if executor is None:
+            return [self._learn(lbda) for lbda in lbdas]
+
+        params = self.get_params()
+        # The workers only use the kernel matrix, so a kernel function, which may not be picklable, is not sent
+        params.update(kernel='precomputed', n_jobs=1, search_arity=1, callback=None, verbose=False)
+        # The SCS iterates are not sent to the workers, only the coefficients
+        solutions = [(lbda, bound, coef, None) for lbda, bound, coef, state in self.solutions]
+        if kernel_dir is None:
+            kernel_file = self.K_sim.filename
+        else:
+            kernel_file = os.path.join(kernel_dir.name, os.listdir(kernel_dir.name)[0])
+        futures = [executor.submit(_learn_in_worker, params, kernel_file,
+                                   self.y_train, self.s_train, lbda, self.fairness_bound, solutions)
+                   for lbda in lbdas]
+        results = []
+        for lbda, future in zip(lbdas, futures):
+            fair_value, coef, record = future.result()
+            self.n_iter_.append((lbda, self.fairness_bound, record['n_iter']))
+            self.compilation_times.append(record['compile_time'])
+            self.solutions.append((lbda, self.fairness_bound, coef, None))
+            self._record_solve(record)
+            if self.verbose: print("Obtained:",self.fairness_notion, "= %0.4f with lambda = %0.4f (%s solver iterations)" % (fair_value, lbda, record['n_iter']))
+            results.append((fair_value, coef))
+        return results
+
     def predict(self, x_test):
         """Predict the label of test data.
 
         Parameters
         ----------
-        x_test: numpy array
+        x_test: numpy array or scipy sparse matrix
             The features of the test data with shape=(number_points,number_features).
 
         Returns
@@ -184,213 +927,565 @@ class SearchFair(BaseEstimator):
         y_hat: numpy array
             The predicted class labels with shape=(number_points,).
         """
-        kernel_matr = self.kernel_function(x_test, self.x_train[self.reason_pts_index])
-        y_hat = np.dot(self.coef_, np.transpose(kernel_matr))
-        return np.sign(y_hat)
+        return np.sign(self.decision_function(x_test))
+
+    def decision_function(self, x_test):
+        """Compute the real-valued output of the classifier, whose sign is the predicted label.
+        It is computed in blocks of rows, which are spread across n_jobs threads, or whose kernel values are computed
+        by n_jobs threads if there is only one block. The block size is predict_batch_size,
+        or follows from max_memory_mb, so that the memory stays bounded for any number of points.
+
+        Parameters
+        ----------
+        x_test: numpy array or scipy sparse matrix
+            The features of the test data with shape=(number_points,number_features).
+
+        Returns
+        ----------
+        y_hat: numpy array
+            The decision values with shape=(number_points,).
+        """
+        if sp.issparse(x_test):
+            x_test = x_test.tocsr()
+        nmb_pts = x_test.shape[0]
+        batch_size = self._predict_batch_size()
+        y_hat = np.empty(nmb_pts, dtype=self.coef_.dtype)
+
+        def score_block(start, kernel_jobs=None):
+            features = self._feature_map(x_test[start:start + batch_size], n_jobs=kernel_jobs)
+            y_hat[start:start + batch_size] = features @ self.coef_ + self.intercept_
+
+        starts = range(0, nmb_pts, batch_size)
+        n_jobs = self._effective_n_jobs()
+        if n_jobs == 1 or nmb_pts <= batch_size:
+            # The threads of the kernel share each block
+            for start in starts:
+                score_block(start)
+        else:
+            # Every thread computes whole blocks, so the kernel of each block is not split again
+            with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+                list(executor.map(lambda start: score_block(start, kernel_jobs=1), starts))
+        return y_hat
+
+    def check_dtype(self, x_test, y_test, s_test, reference=None):
+        """Report the change of accuracy and fairness caused by the dtype of the estimator. The predictions are
+        compared to those of reference, a SearchFair fitted on the same data with another dtype, usually np.float64.
+        If reference is None, the weights of this model are used with float64 kernel values, which only shows
+        the effect of dtype on predict.
+
+        Parameters
+        ----------
+        x_test: numpy array
+            The features of the test data with shape=(number_points,number_features).
+        y_test: numpy array
+            The class labels of the test data with shape=(number_points,).
+        s_test: numpy array
+            The binary sensitive attributes of the test data with shape=(number_points,).
+        reference: SearchFair
+            The fitted model to compare to.
+
+        Returns
+        ----------
+        report: dict
+            'accuracy', 'DDP' and 'DEO' map to the tuples (value of reference, value of this model, difference),
+            and 'changed_predictions' to the share of the points whose predicted label differs.
+        """
+        y_predicted = self.predict(x_test)
+        if reference is not None:
+            y_reference = reference.predict(x_test)
+        else:
+            batch_size = self._predict_batch_size()
+            coef = self.coef_.astype(np.float64)
+            y_reference = np.concatenate([np.sign(self._feature_map(x_test[start:start + batch_size], np.float64) @ coef + self.intercept_)
+                                          for start in range(0, x_test.shape[0], batch_size)])
+
+        report = {}
+        measures = zip(['DDP', 'DEO'], self.compute_fairness_measures(y_reference, y_test, s_test),
+                       self.compute_fairness_measures(y_predicted, y_test, s_test))
+        for measure, value_reference, value in [('accuracy', np.mean(y_reference == y_test), np.mean(y_predicted == y_test))] + list(measures):
+            report[measure] = (value_reference, value, value - value_reference)
+        report['changed_predictions'] = np.mean(y_predicted != y_reference)
+        if self.verbose:
+            for measure in ['accuracy', 'DDP', 'DEO']:
+                print("%s: %0.4f with the reference, %0.4f with %s (%+0.4f)"
+                      % (measure, report[measure][0], report[measure][1], self._dtype().name, report[measure][2]))
+            print("Changed predictions: %0.4f" % report['changed_predictions'])
+        return report
+
+    def _predict_batch_size(self):
+        """Number of rows in each block of predict. The kernel values and the features of a block take about
+        the size of dtype per reasonable point and weight, for each of the n_jobs threads.
+        """
+        if self.predict_batch_size is not None:
+            return self.predict_batch_size
+        row_bytes = self._dtype().itemsize * (self.reason_pts.shape[0] + len(self.coef_)) * self._effective_n_jobs()
+        return max(1, int(self.max_memory_mb * 2 ** 20 / row_bytes))
+
+    def _effective_n_jobs(self):
+        """The number of processes or threads given by n_jobs."""
+        if self.n_jobs is None:
+            return 1
+        if self.n_jobs < 0:
+            return max(1, os.cpu_count() + 1 + self.n_jobs)
+        return self.n_jobs
+
+    def kernel_function(self, X, Y, Y_sq_norms=None, out=None, n_jobs=None):
+        """Compute the kernel matrix between two sets of points. The built-in kernels are computed by
+        searchfair.kernels.pairwise_kernel in tiles across n_jobs threads.
+
+        Parameters
+        ----------
+        X: numpy array
+            The features of the first points with shape=(number_points_X,number_features).
+        Y: numpy array
+            The features of the second points with shape=(number_points_Y,number_features).
+        Y_sq_norms: numpy array
+            The squared norms of the rows of Y for the rbf kernel, if they are known.
+        out: numpy array
+            An array with shape=(number_points_X,number_points_Y) in which the kernel matrix is written.
+        n_jobs: int
+            The number of threads. If None, n_jobs of the estimator is used.
+
+        Returns
+        ----------
+        kernel_matr: numpy array
+            The kernel matrix with shape=(number_points_X,number_points_Y).
+        """
+        n_jobs = self.n_jobs if n_jobs is None else n_jobs
+        if self.kernel == 'rbf':
+            return pairwise_kernel(X, Y, 'rbf', gamma=self.gamma, Y_sq_norms=Y_sq_norms, out=out, n_jobs=n_jobs)
+        elif self.kernel == 'poly':
+            return pairwise_kernel(X, Y, 'poly', degree=3 if self.gamma is None else self.gamma, out=out, n_jobs=n_jobs)
+        elif self.kernel == 'linear':
+            return pairwise_kernel(X, Y, 'linear', out=out, n_jobs=n_jobs)
+        kernel_matr = self.kernel(X, Y)
+        if out is None:
+            return kernel_matr
+        out[...] = kernel_matr
+        return out
+
+    def _feature_map(self, x, dtype=None, n_jobs=None):
+        """Compute the features of the given points that the weights coef_ apply to.
+        These are the kernel values with the reasonable points, their Nystroem projection for kernel_approx='nystroem',
+        the random Fourier features for kernel_approx='rff', or the features themselves for primal=True.
+
+        Parameters
+        ----------
+        x: numpy array
+            The features of the points with shape=(number_points,number_features).
+        dtype: numpy dtype
+            The type of the features. If None, it is the dtype of the estimator.
+        n_jobs: int
+            The number of threads of the kernel. If None, n_jobs of the estimator is used.
+
+        Returns
+        ----------
+        features: numpy array
+            The array with shape=(number_points,number_coefficients).
+        """
+        dtype = self._dtype() if dtype is None else np.dtype(dtype)
+        if self.primal:
+            features = x
+        elif self.kernel == 'precomputed':
+            features = x[:, self.reason_pts_index]
+        elif self.kernel_approx == 'rff':
+            features = self.rff_sampler.transform(x)
+        else:
+            # The kernel is written directly in dtype, with the cached squared norms of the reasonable points
+            features = self.kernel_function(x, self.reason_pts, Y_sq_norms=getattr(self, 'reason_pts_sq_norms', None),
+                                            out=np.empty((x.shape[0], self.reason_pts.shape[0]), dtype=dtype), n_jobs=n_jobs)
+            if self.kernel_approx == 'nystroem':
+                features = features @ self.nystroem_normalization.astype(dtype, copy=False)
+        return features.astype(dtype, copy=False)
+
+    def _kernel_matrix(self, x):
+        """Compute the matrix K_sim of the features of _design_matrix for the training data.
+        For out_of_core=True, it is computed in blocks of rows, and written to a scratch file that is memory-mapped
+        if it is larger than max_memory_mb.
+        """
+        if not self.out_of_core or sp.issparse(x) and self.primal:
+            return self._design_matrix(x)
+        nmb_pts = x.shape[0]
+        nmb_coefs = self._design_matrix(x[:1]).shape[1]
+        # Computing a block also takes the kernel values with the reasonable points
+        block_rows = self._block_rows(nmb_coefs + self.reason_pts.shape[0])
+        blocks = (self._design_matrix(x[start:start + block_rows]) for start in range(0, nmb_pts, block_rows))
+        if self._dtype().itemsize * nmb_pts * nmb_coefs <= self.max_memory_mb * 2 ** 20:
+            return np.vstack(list(blocks))
+
+        # The blocks are appended to the file, since the written pages of a memmap would stay in memory
+        self.scratch_dir = tempfile.TemporaryDirectory()
+        kernel_file = os.path.join(self.scratch_dir.name, 'kernel.npy')
+        with open(kernel_file, 'wb') as f:
+            np.lib.format.write_array_header_1_0(f, {'descr': np.lib.format.dtype_to_descr(self._dtype()),
+                                                     'fortran_order': False, 'shape': (nmb_pts, nmb_coefs)})
+            for block in blocks:
+                np.ascontiguousarray(block, dtype=self._dtype()).tofile(f)
+        return np.load(kernel_file, mmap_mode='r')
+
+    def _kernel_blocks(self):
+        """Iterate over blocks of rows of K_sim, as tuples (rows, kernel_block). A memory-mapped kernel matrix
+        is read from its file in blocks that fit in max_memory_mb, and any other one is a single block.
+        The blocks share one buffer, so each block is only valid until the next one is read.
+        """
+        if not isinstance(self.K_sim, np.memmap):
+            yield slice(None), self.K_sim
+            return
+        nmb_pts, nmb_coefs = self.K_sim.shape
+        buffer = np.empty((min(self._block_rows(nmb_coefs), nmb_pts), nmb_coefs), dtype=self.K_sim.dtype)
+        # Reading the file instead of the pages of the memmap keeps them out of the memory of the process
+        with open(self.K_sim.filename, 'rb') as f:
+            f.seek(self.K_sim.offset)
+            for start in range(0, nmb_pts, len(buffer)):
+                kernel_block = buffer[:min(len(buffer), nmb_pts - start)]
+                f.readinto(kernel_block)
+                yield slice(start, start + len(kernel_block)), kernel_block
+
+    def _block_rows(self, nmb_values):
+        """Number of rows of the blocks of K_sim that fit in max_memory_mb, with nmb_values values of dtype per row."""
+        return max(1, int(self.max_memory_mb * 2 ** 20 / (self._dtype().itemsize * nmb_values)))
+
+    def _dtype(self):
+        """The numpy dtype of the parameter dtype, which has to be float32 or float64."""
+        dtype = np.dtype(self.dtype)
+        if dtype not in [np.float32, np.float64]:
+            raise ValueError("dtype has to be np.float32 or np.float64.")
+        return dtype
+
+    def _design_matrix(self, x):
+        """The features of _feature_map, with a last column of ones for the bias if primal=True."""
+        features = self._feature_map(x)
+        if not self.primal:
+            return features
+        if sp.issparse(features):
+            return sp.hstack([features, np.ones((features.shape[0], 1), dtype=features.dtype)], format='csr')
+        return np.hstack([features, np.ones((features.shape[0], 1), dtype=features.dtype)])
+
+    def _setup_features(self, x):
+        """Check the combination of kernel, primal and kernel_approx, and fit the kernel approximation on the points x.
+        For kernel_approx='nystroem', the reasonable points are the landmarks and have to be set before.
+        """
+        if self.primal and self.kernel != 'linear':
+            raise ValueError("primal=True is only available for kernel='linear'.")
+        if self.kernel == 'precomputed' and self.kernel_approx is not None:
+            raise ValueError("kernel='precomputed' is only available for kernel_approx=None.")
+        if self.primal:
+            return
+        if self.kernel_approx == 'nystroem':
+            self._fit_nystroem()
+        elif self.kernel_approx == 'rff':
+            if self.kernel != 'rbf':
+                raise ValueError("kernel_approx='rff' is only available for kernel='rbf'.")
+            gamma = 1.0 / x.shape[1] if self.gamma is None else self.gamma
+            self.rff_sampler = RBFSampler(gamma=gamma, n_components=self.n_components,
+                                          random_state=self.random_state).fit(x)
+
+    def _fit_nystroem(self):
+        """Compute the normalization of the Nystroem approximation, which uses the reasonable points as landmarks.
+        The kernel is approximated by k(x, L) K_LL^-1 k(L, y), where K_LL is the kernel matrix of the landmarks L.
+        Directions with a numerically zero eigenvalue of K_LL are dropped.
+        """
+        # The decomposition is always done in float64, since small eigenvalues are inverted
+        reason_pts = self.reason_pts.astype(np.float64)
+        eigvals, eigvecs = np.linalg.eigh(self.kernel_function(reason_pts, reason_pts))
+        keep = eigvals > 1e-10 * np.max(eigvals)
+        self.nystroem_normalization = (eigvecs[:, keep] / np.sqrt(eigvals[keep])).astype(self._dtype())
 
     def _preprocess(self):
-        """Setting the attributes loss_func, kernel_function, and weight_vector,
+        """Setting the attributes loss_func and weight_vector,
         which depends on the fairness notion, and is used in fairness related objects.
         """
         self.coef_ = None
         self.fairness_lambda = 0
+        self.fairness_bound = 'upper'
+        self._set_functions()
+
+        self.nmb_pts = len(self.s_train)
+        self.nmb_unprotected = np.sum(self.s_train == 1)
+        self.prob_unprot = self.nmb_unprotected / self.nmb_pts
+        self.prob_prot = 1 - self.prob_unprot
+
+        self.nmb_pos = np.sum(self.y_train == 1)
+        self.nmb_prot_pos = np.sum(self.y_train[self.s_train == -1] == 1)
+        self.prob_prot_pos = self.nmb_prot_pos / self.nmb_pos
+        self.prob_unprot_pos = 1 - self.prob_prot_pos
+
+        # Create weights that are necessary for the fairness constraint
+        if self.fairness_notion == 'DDP':
+            normalizer = self.nmb_pts
+            self.weight_vector = np.where(self.s_train == -1, 1.0 / self.prob_prot, 1.0 / self.prob_unprot).reshape(-1, 1)
+            self.weight_vector = (1 / normalizer) * self.weight_vector
+        elif self.fairness_notion == 'DEO':
+            normalizer = self.nmb_pos
+            self.weight_vector = np.where(self.s_train == -1, 1.0 / self.prob_prot_pos, 1.0 / self.prob_unprot_pos).reshape(-1, 1)
+            self.weight_vector = 0.5 * (self.y_train.reshape(-1, 1) + 1) * self.weight_vector
+            self.weight_vector = (1 / normalizer) * self.weight_vector
+
+    def _set_functions(self):
+        """Setting the loss and the bounds of Wu et al. as cvxpy expressions, and as the functions of the native
+        and sgd solvers.
+        """
+        # The native_* functions return the value and the derivative of their cvxpy counterparts
         if self.loss_name == 'logistic':
             self.loss_func = lambda z: cp.logistic(-z)
+            self.native_loss = lambda z: (np.logaddexp(0, -z), -expit(-z))
         elif self.loss_name == 'hinge':
             self.loss_func = lambda z: cp.pos(1.0 - z)
+            self.native_loss = lambda z: _smooth_pos(1.0 - z, -1.0)
         elif self.loss_name == 'squared':
             self.loss_func = lambda z: cp.square(-z)
+            self.native_loss = lambda z: (z ** 2, 2 * z)
         elif self.loss_name == 'exponential':
             self.loss_func = lambda z: cp.exp(-z)
+            self.native_loss = lambda z: (np.exp(-z), -np.exp(-z))
         else:
             print('Using default loss: hinge loss.')
             self.loss_func = lambda z: cp.pos(1.0 - z)
+            self.native_loss = lambda z: _smooth_pos(1.0 - z, -1.0)
 
-        if self.kernel == 'rbf':
-            self.kernel_function = lambda X, Y: kernels.rbf_kernel(X, Y, self.gamma)
-        elif self.kernel == 'poly':
-            self.kernel_function = lambda X, Y: kernels.polynomial_kernel(X, Y, degree=self.gamma)
-        elif self.kernel == 'linear':
-            self.kernel_function = lambda X, Y: kernels.linear_kernel(X, Y) + 1
-        else:
-            self.kernel_function = kernel
-
+        # For all bounds, delta(z) = 1 - kappa(-z), so the native solver only needs kappa
         if self.wu_bound == 'logistic':
             self.cvx_kappa = lambda z: cp.logistic(z)
             self.cvx_delta = lambda z: 1 - cp.logistic(-z)
+            self.native_kappa = lambda z: (np.logaddexp(0, z), expit(z))
         elif self.wu_bound == 'hinge':
             self.cvx_kappa = lambda z: cp.pos(1 + z)
             self.cvx_delta = lambda z: 1 - cp.pos(1 - z)
+            self.native_kappa = lambda z: _smooth_pos(1.0 + z)
         elif self.wu_bound == 'squared':
             self.cvx_kappa = lambda z: cp.square(1 + z)
             self.cvx_delta = lambda z: 1 - cp.square(1 - z)
+            self.native_kappa = lambda z: ((1 + z) ** 2, 2 * (1 + z))
         elif self.wu_bound == 'exponential':
             self.cvx_kappa = lambda z: cp.exp(z)
             self.cvx_delta = lambda z: 1 - cp.exp(-z)
+            self.native_kappa = lambda z: (np.exp(z), np.exp(z))
         else:
             print('Using default bound with hinge.')
             self.cvx_kappa = lambda z: cp.pos(1 + z)
             self.cvx_delta = lambda z: 1 - cp.pos(1 - z)
+            self.native_kappa = lambda z: _smooth_pos(1.0 + z)
 
-        self.nmb_pts = len(self.s_train)
-        self.nmb_unprotected = np.sum(self.s_train == 1)
-        self.prob_unprot = self.nmb_unprotected / self.nmb_pts
-        self.prob_prot = 1 - self.prob_unprot
-
-        self.nmb_pos = np.sum(self.y_train == 1)
-        self.nmb_prot_pos = np.sum(self.y_train[self.s_train == -1] == 1)
-        self.prob_prot_pos = self.nmb_prot_pos / self.nmb_pos
-        self.prob_unprot_pos = 1 - self.prob_prot_pos
-
-        # Create weights that are necessary for the fairness constraint
-        if self.fairness_notion == 'DDP':
-            normalizer = self.nmb_pts
-            self.weight_vector = np.array(
-                [1.0 / self.prob_prot if self.s_train[i] == -1 else 1.0 / self.prob_unprot for i in range(len(self.s_train))]).reshape(-1,1)
-            self.weight_vector = (1 / normalizer) * self.weight_vector
-        elif self.fairness_notion == 'DEO':
-            normalizer = self.nmb_pos
-            self.weight_vector = np.array(
-                [1.0 / self.prob_prot_pos if self.s_train[i] == -1 else 1.0 / self.prob_unprot_pos for i in range(len(self.s_train))]).reshape(-1, 1)
-            self.weight_vector = 0.5 * (self.y_train.reshape(-1, 1) + 1) * self.weight_vector
-            self.weight_vector = (1 / normalizer) * self.weight_vector
+    def _select_reason_points(self):
+        """Choose the reasonable points among the training data, following reason_point_strategy.
+        For kernel_approx='nystroem', they are the landmark points.
+        """
+        if self.primal or self.kernel_approx == 'rff':
+            # Random Fourier features and the primal formulation do not depend on any training point
+            self.reason_pts_index = np.array([], dtype=int)
+            self.nmb_reason_pts = 0
+            return
+        if self.kernel_approx == 'nystroem':
+            nmb_reason_pts = min(self.n_components, self.nmb_pts)
+        elif self.reason_points <= 1:
+            nmb_reason_pts = int(self.nmb_pts * self.reason_points)
+        else:
+            nmb_reason_pts = self.reason_points
+        random_state = check_random_state(self.random_state)
 
-        # Choose random reasonable points
-        if self.reason_points <= 1:
-            self.reason_pts_index = list(range(int(self.nmb_pts * self.reason_points)))
+        if self.reason_point_strategy == 'first':
+            self.reason_pts_index = np.arange(nmb_reason_pts)
+        elif self.reason_point_strategy == 'random':
+            self.reason_pts_index = random_state.choice(self.nmb_pts, nmb_reason_pts, replace=False)
+        elif self.reason_point_strategy == 'stratified':
+            # Every group (y, s) gets a share of the reasonable points proportional to its size
+            groups = 2 * (self.y_train == 1) + (self.s_train == 1)
+            shares = nmb_reason_pts * np.bincount(groups, minlength=4) / self.nmb_pts
+            quotas = np.floor(shares).astype(int)
+            quotas[np.argsort(quotas - shares)[:nmb_reason_pts - np.sum(quotas)]] += 1
+            self.reason_pts_index = np.concatenate(
+                [random_state.choice(np.flatnonzero(groups == group), quotas[group], replace=False) for group in range(4)])
+        elif self.reason_point_strategy == 'kmeans':
+            # The reasonable points are the training points closest to the k-means centroids
+            kmeans = MiniBatchKMeans(n_clusters=nmb_reason_pts, random_state=random_state, n_init=3).fit(self.x_train)
+            self.reason_pts_index = np.unique(pairwise_distances_argmin(kmeans.cluster_centers_, self.x_train))
+        elif self.reason_point_strategy == 'leverage':
+            # Ridge leverage scores of the kernel matrix, approximated with a Nystroem projection on a uniform sample
+            sample = random_state.choice(self.nmb_pts, min(self.nmb_pts, 2 * nmb_reason_pts), replace=False)
+            if self.kernel == 'precomputed':
+                kernel_matr = self.x_train[:, sample]
+            else:
+                kernel_matr = self.kernel_function(self.x_train, self.x_train[sample])
+            eigvals, eigvecs = np.linalg.eigh(kernel_matr[sample])
+            keep = eigvals > 1e-10 * np.max(eigvals)
+            features = kernel_matr @ (eigvecs[:, keep] / np.sqrt(eigvals[keep]))
+            ridge = self.nmb_pts * (self.reg_beta if self.reg_beta > 0 else 1e-3)
+            scores = np.sum(features * np.linalg.solve(features.T @ features + ridge * np.eye(features.shape[1]), features.T).T, axis=1)
+            probabilities = (scores + 1e-12) / np.sum(scores + 1e-12)
+            self.reason_pts_index = random_state.choice(self.nmb_pts, nmb_reason_pts, replace=False, p=probabilities)
         else:
-            self.reason_pts_index = list(range(self.reason_points))
+            raise ValueError("Unknown reason_point_strategy '%s'." % self.reason_point_strategy)
         self.nmb_reason_pts = len(self.reason_pts_index)
 
     def _construct_problem(self, bound='upper'):
         """ Construct the cvxpy minimization problem.
         It depends on the fairness regularizer chosen.
+
+        The problem is DPP-compliant with lambda and beta as its parameters, so it is canonicalized on its first solve,
+        and every later lambda or beta only updates the parameter values. lambda_min = 0 is covered by the same problem.
+        The kernel matrix is a constant of the problem, since it does not change during a fit.
         """
 
         # Variable to optimize
-        self.alpha_var = cp.Variable((len(self.reason_pts_index), 1))
-        # Parameter for Kernel Matrix
-        self.kernel_matrix = cp.Parameter(shape=(self.x_train.shape[0], len(self.reason_pts_index)))
-        self.fair_reg_cparam = cp.Parameter(nonneg=True)
-
-
-        # Form SVM with L2 regularization
-        if self.fairness_lambda == 0:
-            self.loss = cp.sum(self.loss_func(cp.multiply(self.y_train.reshape(-1, 1), self.kernel_matrix @ self.alpha_var))) + self.reg_beta * self.nmb_pts * cp.square(
-                cp.norm(self.alpha_var, 2))
-        else:
-            sy_hat = cp.multiply(self.s_train.reshape(-1, 1), self.kernel_matrix @ self.alpha_var)
+        alpha_var = cp.Variable((self.K_sim.shape[1], 1))
+        # Parameter for lambda
+        fair_reg_cparam = cp.Parameter(nonneg=True)
+        # Parameter for beta
+        reg_beta_cparam = cp.Parameter(nonneg=True)
 
-            if self.fairness_regularizer == 'wu':
-                if bound == 'upper':
-                    fairness_relaxation = cp.sum(cp.multiply(self.weight_vector, self.cvx_kappa(sy_hat))) - 1
-                else:
-                    fairness_relaxation = -1 * cp.sum(cp.multiply(self.weight_vector, self.cvx_delta(sy_hat))) - 1
+        y_hat = self.K_sim @ alpha_var
+        sy_hat = cp.multiply(self.s_train.reshape(-1, 1), y_hat)
 
-
-            elif self.fairness_regularizer == 'linear':
-                if bound == 'upper':
-                    fairness_relaxation = cp.sum(cp.multiply(self.weight_vector, self.kernel_matrix @ self.alpha_var))
-                else:
-                    fairness_relaxation = -1 * cp.sum(cp.multiply(self.weight_vector, self.kernel_matrix @ self.alpha_var))
-
-            if self.reg_beta == 0:
-                self.loss = (1/self.nmb_pts) * cp.sum(self.loss_func(cp.multiply(self.y_train.reshape(-1, 1), self.kernel_matrix @ self.alpha_var))) + \
-                                self.fair_reg_cparam * fairness_relaxation
+        if self.fairness_regularizer == 'wu':
+            if bound == 'upper':
+                fairness_relaxation = cp.sum(cp.multiply(self.weight_vector, self.cvx_kappa(sy_hat))) - 1
             else:
-                self.loss = (1 / self.nmb_pts) * cp.sum(self.loss_func(cp.multiply(self.y_train.reshape(-1, 1), self.kernel_matrix @ self.alpha_var))) + \
-                            self.fair_reg_cparam * fairness_relaxation + self.reg_beta * cp.square(cp.norm(self.alpha_var, 2))
+                fairness_relaxation = -1 * cp.sum(cp.multiply(self.weight_vector, self.cvx_delta(sy_hat))) - 1
+        elif self.fairness_regularizer == 'linear':
+            if bound == 'upper':
+                fairness_relaxation = cp.sum(cp.multiply(self.weight_vector, y_hat))
+            else:
+                fairness_relaxation = -1 * cp.sum(cp.multiply(self.weight_vector, y_hat))
+
+        # Form SVM with L2 regularization
+        loss = (1 / self.nmb_pts) * cp.sum(self.loss_func(cp.multiply(self.y_train.reshape(-1, 1), y_hat))) + \
+               fair_reg_cparam * fairness_relaxation
+        loss = loss + reg_beta_cparam * cp.square(cp.norm(alpha_var, 2))
 
-        self.prob = cp.Problem(cp.Minimize(self.loss))
+        return cp.Problem(cp.Minimize(loss)), alpha_var, fair_reg_cparam, reg_beta_cparam
 
     def _optimize(self):
         """Conduct the optimization of the created problem by using ECOS or SCS
         with cvxpy. 
         """
 
-        # Compute and initialize kernel matrix
-        self.K_sim = self.kernel_function(self.x_train, self.x_train[self.reason_pts_index])
-        self.kernel_matrix.value = self.K_sim
+        warm_coef, warm_state = self._nearest_solution()
+        if self.solver == 'native':
+            self._optimize_native(warm_coef)
+            return
+
+        # The problem for each bound is only built once per fit
+        if self.fairness_bound not in self.problems:
+            start = time.perf_counter()
+            self.problems[self.fairness_bound] = self._construct_problem(bound=self.fairness_bound)
+            self.solve_record['construct_time'] = time.perf_counter() - start
+        self.prob, self.alpha_var, self.fair_reg_cparam, self.reg_beta_cparam = self.problems[self.fairness_bound]
         self.fair_reg_cparam.value = self.fairness_lambda
+        self.reg_beta_cparam.value = self.reg_beta
+        # SCS reads its warm start (x, y, s) from the solver cache of the problem. This is a private attribute of
+        # cvxpy, which only writes it after an optimal solve. Without a warm state, the iterate of the previous
+        # solve of the problem is removed, so that SCS starts cold.
+        if warm_state is not None:
+            self.prob._solver_cache['SCS'] = warm_state
+        else:
+            self.prob._solver_cache.pop('SCS', None)
 
         if self.verbose == 2:
             verbose = True
         else:
             verbose = False
+        start = time.perf_counter()
         if self.solver == 'SCS':
-            self.prob.solve(solver=cp.SCS, max_iters=self.max_iter, verbose=verbose, warm_start=True)
+            self.prob.solve(solver=cp.SCS, max_iters=self.max_iter, verbose=verbose, warm_start=self._continuation())
         elif self.solver == 'ECOS':
             try:
-                self.prob.solve(solver=cp.ECOS, max_iters=self.max_iter, verbose=verbose, warm_start=True)
+                self.prob.solve(solver=cp.ECOS, max_iters=self.max_iter, verbose=verbose, warm_start=self._continuation())
             except Exception as e:
-                self.prob.solve(solver=cp.SCS, max_iters=self.max_iter, verbose=verbose, warm_start=True)
+                self.prob.solve(solver=cp.SCS, max_iters=self.max_iter, verbose=verbose, warm_start=self._continuation())
+        self.compilation_times.append(self.prob.compilation_time)
+        self.solve_record.update(status=self.prob.status, compile_time=self.prob.compilation_time,
+                                 solve_time=time.perf_counter() - start - self.prob.compilation_time)
         if verbose:
             print('status %s ' % self.prob.status)
             print('value %s ' % self.prob.value)
         self.coef_ = self.alpha_var.value.squeeze()
+        self.n_iter_.append((self.fairness_lambda, self.fairness_bound, self.prob.solver_stats.num_iters))
+        # After a solve that is not optimal, the solver cache still holds the iterate of an earlier lambda
+        state = self.prob._solver_cache.get('SCS') if self.prob.status == cp.OPTIMAL else None
+        self.solutions.append((self.fairness_lambda, self.fairness_bound, self.coef_.copy(), state))
 
-    def compute_fairness_measures(self, y_predicted, y_true, sens_attr):
-        """Compute value of demographic parity and equality of opportunity for given predictions.
+    def _continuation(self):
+        """Whether lambdas are warm started, following continuation."""
+        if self.continuation is None:
+            return self.solver == 'native'
+        return self.continuation
 
-        Parameters
-        ----------
-        y_predicted: numpy array
-            The predicted class labels of shape=(number_points,).
-        y_true: numpy array
-            The true class labels of shape=(number_points,).
-        sens_attr: numpy array
-            The sensitive labels of shape=(number_points,).
+    def _nearest_solution(self):
+        """Find the solution of the already solved lambda that is closest to the current one.
 
         Returns
         ----------
-        DDP: float
-            The difference of demographic parity.
-        DEO: float
-            The difference of equality of opportunity.
+        warm_coef: numpy array
+            The coefficients of the nearest solution, or None if there is none.
+        warm_state: dict
+            The SCS iterates of the nearest solution for the same bound, or None if there are none.
         """
-        positive_rate_prot = self.get_positive_rate(y_predicted[sens_attr==-1], y_true[sens_attr==-1])
-        positive_rate_unprot = self.get_positive_rate(y_predicted[sens_attr==1], y_true[sens_attr==1])
-        true_positive_rate_prot = self.get_true_positive_rate(y_predicted[sens_attr==-1], y_true[sens_attr==-1])
-        true_positive_rate_unprot = self.get_true_positive_rate(y_predicted[sens_attr==1], y_true[sens_attr==1])
-        DDP = positive_rate_unprot - positive_rate_prot
-        DEO = true_positive_rate_unprot - true_positive_rate_prot
+        if not self._continuation() or len(self.solutions) == 0:
+            return None, None
+        # The latest of equally close solutions, which is from the most similar model if they are shared
+        lbda, bound, coef, state = min(reversed(self.solutions), key=lambda solution: abs(solution[0] - self.fairness_lambda))
+        if bound != self.fairness_bound:
+            state = None
+        return coef, state
 
-        return DDP, DEO
+    def _optimize_native(self, warm_coef=None):
+        """Conduct the optimization with L-BFGS directly on the kernel matrix, without cvxpy.
+        The objective is the same as in _construct_problem, where max(0, z) is replaced by a Huber smoothing.
+        """
+        y = self.y_train.ravel()
+        s = self.s_train.ravel()
+        w = self.weight_vector.ravel()
+        # The lower bound of Wu et al. is the upper bound with flipped sensitive attributes, up to a constant
+        bound_sign = 1.0 if self.fairness_bound == 'upper' else -1.0
 
-    def get_positive_rate(self, y_predicted, y_true):
-        """Compute the positive rate for given predictions of the class label.
+        def objective(alpha):
+            value = self.reg_beta * np.dot(alpha, alpha)
+            alpha_grad = 2 * self.reg_beta * alpha
+            # Only the products with the kernel matrix are done in its dtype, and the rest in float64
+            alpha_kernel = alpha.astype(self.K_sim.dtype, copy=False)
+            # All terms but the regularization are sums over the points, so the kernel matrix is read once per call
+            for rows, kernel_block in self._kernel_blocks():
+                y_hat = (kernel_block @ alpha_kernel).astype(np.float64, copy=False)
+                loss, loss_grad = self.native_loss(y[rows] * y_hat)
+                value += np.sum(loss) / self.nmb_pts
+                y_hat_grad = y[rows] * loss_grad / self.nmb_pts
+                if self.fairness_lambda != 0:
+                    if self.fairness_regularizer == 'wu':
+                        kappa, kappa_grad = self.native_kappa(bound_sign * s[rows] * y_hat)
+                        value += self.fairness_lambda * np.dot(w[rows], kappa)
+                        y_hat_grad += self.fairness_lambda * bound_sign * s[rows] * w[rows] * kappa_grad
+                    elif self.fairness_regularizer == 'linear':
+                        value += self.fairness_lambda * bound_sign * np.dot(w[rows], y_hat)
+                        y_hat_grad += self.fairness_lambda * bound_sign * w[rows]
+                alpha_grad += kernel_block.T @ y_hat_grad.astype(kernel_block.dtype, copy=False)
+            return value, alpha_grad
 
-        Parameters
-        ----------
-        y_predicted: numpy array
-            The predicted class labels of shape=(number_points,).
-        y_true: numpy array
-            The true class labels of shape=(number_points,).
+        start = time.perf_counter()
+        with np.errstate(over='ignore'):
+            alpha_start = np.zeros(self.K_sim.shape[1]) if warm_coef is None else warm_coef
+            result = minimize(objective, alpha_start, jac=True, method='L-BFGS-B',
+                              options={'maxiter': self.max_iter})
+        self.solve_record.update(status='optimal' if result.success else result.message,
+                                 solve_time=time.perf_counter() - start)
+        if self.verbose == 2:
+            print('status %s ' % result.message)
+            print('value %s ' % result.fun)
+        self.coef_ = result.x
+        self.n_iter_.append((self.fairness_lambda, self.fairness_bound, result.nit))
+        self.solutions.append((self.fairness_lambda, self.fairness_bound, self.coef_.copy(), None))
 
-        Returns
-        ---------
-        pr: float
-            The positive rate.
+    def compute_fairness_measures(self, y_predicted, y_true, sens_attr):
+        """Compute value of demographic parity and equality of opportunity for given predictions,
+        with searchfair.metrics.compute_fairness_measures.
         """
-        tn, fp, fn, tp = confusion_matrix(y_true, y_predicted).ravel()
-        pr = (tp+fp) / (tp+fp+tn+fn)
-        return pr
+        return compute_fairness_measures(y_predicted, y_true, sens_attr)
 
-    def get_true_positive_rate(self, y_predicted, y_true):
-        """Compute the true positive rate for given predictions of the class label.
-
-        Parameters
-        ----------
-        y_predicted: numpy array
-            The predicted class labels of shape=(number_points,).
-        y_true: numpy array
-            The true class labels of shape=(number_points,).
+    def get_positive_rate(self, y_predicted, y_true):
+        """Compute the positive rate for given predictions of the class label, with searchfair.metrics.get_positive_rate."""
+        return get_positive_rate(y_predicted, y_true)
 
-        Returns
-        ---------
-        tpr: float
-            The true positive rate.
+    def get_true_positive_rate(self, y_predicted, y_true):
+        """Compute the true positive rate for given predictions of the class label,
+        with searchfair.metrics.get_true_positive_rate.
         """
-        tn, fp, fn, tp = confusion_matrix(y_true, y_predicted).ravel()
-        tpr = tp / (tp+fn)
-        return tpr
+        return get_true_positive_rate(y_predicted, y_true)
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+__all__ = ['pairwise_kernel', 'squared_norms']
+
+from concurrent.futures import ThreadPoolExecutor
+import sklearn.metrics.pairwise as sk_kernels
+import numpy as np
+import scipy.sparse as sp
+import os
+
+# The size in bytes of the float64 tiles in which the kernel matrix is filled
+TILE_BYTES = 2 ** 21
+
+
+def squared_norms(X):
+    """Compute the squared euclidean norms of the rows of X in float64, as used by the rbf kernel.
+
+    Parameters
+    ----------
+    X: numpy array or scipy sparse matrix
+        The points with shape=(number_points,number_features).
+
+    Returns
+    ----------
+    sq_norms: numpy array
+        The squared norms with shape=(number_points,).
+    """
+    if sp.issparse(X):
+        return np.asarray(X.multiply(X).sum(axis=1), dtype=np.float64).ravel()
+    X = np.asarray(X, dtype=np.float64)
+    return np.einsum('ij,ij->i', X, X)
+
+
+def pairwise_kernel(X, Y, kernel='rbf', gamma=None, degree=3, coef0=1, Y_sq_norms=None, out=None, n_jobs=None,
+                    tile_bytes=TILE_BYTES):
+    """Compute the kernel matrix between two sets of points, in tiles of rows that are spread across threads.
+    Each tile is computed in float64 with one matrix product, and the rest of the kernel is applied to it in place,
+    so that the only temporaries are the tiles. The squared norms of Y for the rbf kernel can be passed, so that they
+    are not computed again for every X, as for the reasonable points. Sparse inputs are passed to sklearn.
+
+    The kernels are exp(-gamma ||x - y||^2) for 'rbf', (gamma <x, y> + coef0)^degree for 'poly' and <x, y> + coef0
+    for 'linear'. As in sklearn, gamma=None means 1 / number_features.
+
+    Parameters
+    ----------
+    X: numpy array or scipy sparse matrix
+        The features of the first points with shape=(number_points_X,number_features).
+    Y: numpy array or scipy sparse matrix
+        The features of the second points with shape=(number_points_Y,number_features).
+    kernel: string
+        'rbf', 'poly' or 'linear'.
+    gamma: float
+        The scale of the rbf and polynomial kernels.
+    degree: int
+        The degree of the polynomial kernel.
+    coef0: float
+        The constant of the polynomial and linear kernels.
+    Y_sq_norms: numpy array
+        The squared norms of the rows of Y from squared_norms. If None, they are computed for the rbf kernel.
+    out: numpy array or numpy memmap
+        The array with shape=(number_points_X,number_points_Y) in which the kernel matrix is written.
+        If None, a new one is allocated with the dtype of X and Y, or float64 if they are not floating point.
+    n_jobs: int
+        The number of threads. None means 1, and -1 means all processors.
+    tile_bytes: int
+        The size in bytes of the float64 tiles.
+
+    Returns
+    ----------
+    out: numpy array
+        The kernel matrix with shape=(number_points_X,number_points_Y).
+    """
+    if kernel not in ['rbf', 'poly', 'linear']:
+        raise ValueError("Unknown kernel '%s'. Choose one of 'rbf', 'poly' and 'linear'." % kernel)
+    if gamma is None:
+        gamma = 1.0 / X.shape[1]
+    if out is None:
+        dtype = np.result_type(X.dtype, Y.dtype)
+        out = np.empty((X.shape[0], Y.shape[0]), dtype=dtype if np.issubdtype(dtype, np.floating) else np.float64)
+
+    if sp.issparse(X) or sp.issparse(Y):
+        if kernel == 'rbf':
+            out[...] = sk_kernels.rbf_kernel(X, Y, gamma)
+        elif kernel == 'poly':
+            out[...] = sk_kernels.polynomial_kernel(X, Y, degree=degree, gamma=gamma, coef0=coef0)
+        else:
+            out[...] = sk_kernels.linear_kernel(X, Y) + coef0
+        return out
+
+    # The distances of points to themselves are set to exactly 0, as in sklearn
+    same_points = Y is X
+    if kernel == 'rbf':
+        X_sq_norms = squared_norms(X)
+        if Y_sq_norms is None:
+            Y_sq_norms = X_sq_norms if same_points else squared_norms(Y)
+    # The tiles are computed from float64 points, as sklearn does for float32 distances
+    Y = np.asarray(Y, dtype=np.float64)
+    tile_rows = max(1, tile_bytes // (8 * max(1, Y.shape[0])))
+
+    def fill_tile(start):
+        rows = slice(start, min(start + tile_rows, X.shape[0]))
+        direct = out.dtype == np.float64 and not isinstance(out, np.memmap)
+        tile = out[rows] if direct else np.empty((rows.stop - start, Y.shape[0]))
+        np.matmul(np.asarray(X[rows], dtype=np.float64), Y.T, out=tile)
+        if kernel == 'rbf':
+            # ||x - y||^2 = ||x||^2 - 2 <x, y> + ||y||^2, which can be slightly negative by rounding
+            tile *= -2
+            tile += X_sq_norms[rows, None]
+            tile += Y_sq_norms[None, :]
+            np.maximum(tile, 0, out=tile)
+            if same_points:
+                diagonal = np.arange(start, rows.stop)
+                tile[diagonal - start, diagonal] = 0
+            tile *= -gamma
+            np.exp(tile, out=tile)
+        elif kernel == 'poly':
+            tile *= gamma
+            tile += coef0
+            np.power(tile, degree, out=tile)
+        else:
+            tile += coef0
+        if not direct:
+            out[rows] = tile
+
+    starts = range(0, X.shape[0], tile_rows)
+    if n_jobs is None:
+        n_jobs = 1
+    elif n_jobs < 0:
+        n_jobs = max(1, os.cpu_count() + 1 + n_jobs)
+    if n_jobs == 1 or len(starts) == 1:
+        for start in starts:
+            fill_tile(start)
+    else:
+        # numpy releases the GIL in the matrix products and the in-place operations
+        with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+            list(executor.map(fill_tile, starts))
+    return out
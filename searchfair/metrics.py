@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+__all__ = ['compute_fairness_measures', 'get_positive_rate', 'get_true_positive_rate']
+
+import numpy as np
+
+
+def compute_fairness_measures(y_predicted, y_true, sens_attr):
+    """Compute value of demographic parity and equality of opportunity for given predictions.
+    All four rates are obtained from the counts of positive predictions per group (s, y),
+    which are computed in a single pass for all rows of y_predicted.
+
+    Parameters
+    ----------
+    y_predicted: numpy array
+        The predicted class labels of shape=(number_points,), or of shape=(number_models,number_points)
+        for the predictions of several models.
+    y_true: numpy array
+        The true class labels of shape=(number_points,).
+    sens_attr: numpy array
+        The sensitive labels of shape=(number_points,).
+
+    Returns
+    ----------
+    DDP: float or numpy array
+        The difference of demographic parity, with shape=(number_models,) for 2-D predictions.
+    DEO: float or numpy array
+        The difference of equality of opportunity, with shape=(number_models,) for 2-D predictions.
+    """
+    y_predicted = np.asarray(y_predicted)
+    # Groups 0 to 3: (protected, negative), (protected, positive), (unprotected, negative), (unprotected, positive)
+    groups = 2 * (np.asarray(sens_attr) == 1) + (np.asarray(y_true) == 1)
+    group_sizes = np.bincount(groups, minlength=4)
+    positives = (y_predicted == 1).reshape(-1, len(groups)) @ np.eye(4)[groups]
+
+    positive_rate_prot = (positives[:, 0] + positives[:, 1]) / (group_sizes[0] + group_sizes[1])
+    positive_rate_unprot = (positives[:, 2] + positives[:, 3]) / (group_sizes[2] + group_sizes[3])
+    true_positive_rate_prot = positives[:, 1] / group_sizes[1]
+    true_positive_rate_unprot = positives[:, 3] / group_sizes[3]
+    DDP = positive_rate_unprot - positive_rate_prot
+    DEO = true_positive_rate_unprot - true_positive_rate_prot
+
+    if y_predicted.ndim == 1:
+        return DDP[0], DEO[0]
+    return DDP, DEO
+
+
+def get_positive_rate(y_predicted, y_true):
+    """Compute the positive rate for given predictions of the class label.
+
+    Parameters
+    ----------
+    y_predicted: numpy array
+        The predicted class labels of shape=(number_points,), or of shape=(number_models,number_points).
+    y_true: numpy array
+        The true class labels of shape=(number_points,).
+
+    Returns
+    ---------
+    pr: float or numpy array
+        The positive rate.
+    """
+    pr = np.mean(np.asarray(y_predicted) == 1, axis=-1)
+    return pr
+
+
+def get_true_positive_rate(y_predicted, y_true):
+    """Compute the true positive rate for given predictions of the class label.
+
+    Parameters
+    ----------
+    y_predicted: numpy array
+        The predicted class labels of shape=(number_points,), or of shape=(number_models,number_points).
+    y_true: numpy array
+        The true class labels of shape=(number_points,).
+
+    Returns
+    ---------
+    tpr: float or numpy array
+        The true positive rate.
+    """
+    tpr = np.mean(np.asarray(y_predicted)[..., np.asarray(y_true) == 1] == 1, axis=-1)
+    return tpr
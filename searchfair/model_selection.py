@@ -0,0 +1,241 @@
+#!/usr/bin/env python
+__all__ = ['FairSearchCV']
+
+from sklearn.base import BaseEstimator, clone
+from sklearn.model_selection import ParameterGrid, StratifiedKFold
+from sklearn.utils import check_random_state
+import numpy as np
+import time
+
+
+class FairSearchCV(BaseEstimator):
+    """Cross-validated search over the hyperparameters of SearchFair.
+
+    The kernel matrix of all points is computed once for each kernel and gamma, and sliced for the folds,
+    where the candidates are fitted with kernel='precomputed'. Candidates that only differ in reg_beta share
+    the compiled cvxpy problems on each fold, and each lambda is warm started from the solutions of the previous
+    candidates, as long as they have the same reasonable points. With halving=True, the candidates are evaluated
+    on growing subsets of the training folds, and only the best 1/factor of them go on to the next round.
+
+    Parameters
+    ----------
+    estimator: SearchFair
+        The classifier whose hyperparameters are searched.
+    param_grid: dict or list of dicts
+        The values of the hyperparameters to try, as for sklearn's GridSearchCV.
+    cv: int
+        The number of folds. They are stratified by the groups (s, y).
+    scoring: string or function
+        'accuracy', or a function score(y_true, y_predicted, sens_attr) that returns a float, higher being better.
+    fairness_threshold: float
+        If given, only the candidates whose mean absolute fairness measure on the test folds, for the fairness notion
+        of the estimator, is at most fairness_threshold are ranked by their score. The others are ranked after them,
+        by their fairness measure.
+    halving: boolean
+        If True, the candidates are eliminated by successive halving.
+    factor: int
+        For halving=True, the factor by which the number of training points grows and the number of candidates
+        shrinks in each round.
+    min_resources: int
+        For halving=True, the number of training points per fold in the first round. If None, it is chosen so that
+        the last round uses the whole training folds.
+    refit: boolean
+        If True, the best candidate is fitted on all data, and used by predict.
+    random_state: int
+        The seed for the folds and the subsets of halving=True. If the estimator has no random_state, it also seeds
+        one random_state per fold, which all candidates on that fold use.
+    verbose: boolean
+
+    Attributes
+    ----------
+    cv_results_: dict
+        For each candidate evaluated in each round, the keys 'params', 'iter', 'n_resources', 'mean_fit_time',
+        'mean_test_accuracy', 'std_test_accuracy', 'mean_test_DDP', 'mean_test_DEO', 'mean_test_abs_fairness',
+        'mean_test_score', 'std_test_score', 'feasible' and 'rank_test_score' give lists of the same length.
+    best_index_: int
+        The index of the best candidate in cv_results_.
+    best_params_: dict
+        The hyperparameters of the best candidate.
+    best_score_: float
+        The mean score of the best candidate.
+    best_estimator_: SearchFair
+        The best candidate fitted on all data, if refit=True.
+    n_resources_: list
+        The number of training points per fold in each round.
+    """
+
+    def __init__(self, estimator, param_grid, cv=3, scoring='accuracy', fairness_threshold=None, halving=False, factor=3, min_resources=None, refit=True, random_state=None, verbose=False):
+
+        self.estimator = estimator
+        self.param_grid = param_grid
+        self.cv = cv
+        self.scoring = scoring
+        self.fairness_threshold = fairness_threshold
+        self.halving = halving
+        self.factor = factor
+        self.min_resources = min_resources
+        self.refit = refit
+        self.random_state = random_state
+        self.verbose = verbose
+
+    def fit(self, x_train, y_train, s_train=None):
+        """Evaluates all candidates with cross validation, and fits the best one on the given data if refit=True.
+
+        Parameters
+        ----------
+        x_train: numpy array
+            The features of the training data with shape=(number_points,number_features).
+        y_train: numpy array
+            The class labels of the training data with shape=(number_points,).
+        s_train: numpy array
+            The binary sensitive attributes of the training data with shape=(number_points,).
+
+        Returns
+        ----------
+        self: object
+        """
+        if self.scoring != 'accuracy' and not callable(self.scoring):
+            raise ValueError("scoring has to be 'accuracy' or a function score(y_true, y_predicted, sens_attr).")
+        if self.estimator.primal or self.estimator.kernel_approx is not None or self.estimator.solver == 'sgd':
+            raise ValueError("FairSearchCV fits the candidates on precomputed kernel matrices, "
+                             "so primal=True, kernel_approx and solver='sgd' are not available.")
+        y_train, s_train = np.asarray(y_train), np.asarray(s_train)
+        candidates = list(ParameterGrid(self.param_grid))
+        random_state = check_random_state(self.random_state)
+        groups = 2 * (s_train == 1) + (y_train == 1)
+        folds = list(StratifiedKFold(self.cv, shuffle=True, random_state=random_state).split(x_train, groups))
+        # For halving, the subsets of the training folds are the first points of a random order
+        folds = [(random_state.permutation(train), test) for train, test in folds]
+        # Without a random_state of the estimator, all candidates on a fold get the same one, so that randomized
+        # reasonable points agree, and the candidates can share their problems
+        fold_seeds = random_state.randint(np.iinfo(np.int32).max, size=len(folds))
+
+        max_resources = min(len(train) for train, test in folds)
+        if self.halving:
+            nmb_rounds = 1 + int(np.floor(np.log(len(candidates)) / np.log(self.factor)))
+            min_resources = self.min_resources
+            if min_resources is None:
+                min_resources = max_resources // self.factor ** (nmb_rounds - 1)
+            self.n_resources_ = [min(max_resources, min_resources * self.factor ** i) for i in range(nmb_rounds)]
+        else:
+            self.n_resources_ = [max_resources]
+
+        self.cv_results_ = {key: [] for key in ['params', 'iter', 'n_resources', 'mean_fit_time', 'mean_test_accuracy',
+                                                'std_test_accuracy', 'mean_test_DDP', 'mean_test_DEO',
+                                                'mean_test_abs_fairness', 'mean_test_score', 'std_test_score', 'feasible']}
+        remaining = candidates
+        for search_iter, nmb_resources in enumerate(self.n_resources_):
+            if self.verbose:
+                print("Round %d: %d candidates on %d training points per fold" % (search_iter, len(remaining), nmb_resources))
+            round_folds = [(np.sort(train[:nmb_resources]), test) for train, test in folds]
+            results = self._evaluate(x_train, y_train, s_train, remaining, round_folds, fold_seeds)
+            for params, result in zip(remaining, results):
+                self.cv_results_['params'].append(params)
+                self.cv_results_['iter'].append(search_iter)
+                self.cv_results_['n_resources'].append(nmb_resources)
+                for key, value in result.items():
+                    self.cv_results_[key].append(value)
+
+            # The best candidates of this round go on to the next one
+            order = sorted(range(len(remaining)), key=lambda i: self._rank_key(results[i]))
+            remaining = [remaining[i] for i in order[:int(np.ceil(len(remaining) / self.factor))]]
+
+        # The candidates of the last round are ranked first
+        order = sorted(range(len(self.cv_results_['params'])),
+                       key=lambda i: (-self.cv_results_['iter'][i],) + self._rank_key({key: values[i] for key, values in self.cv_results_.items()}))
+        self.cv_results_['rank_test_score'] = list(np.argsort(order) + 1)
+        self.best_index_ = order[0]
+        self.best_params_ = self.cv_results_['params'][self.best_index_]
+        self.best_score_ = self.cv_results_['mean_test_score'][self.best_index_]
+        if self.verbose:
+            print("Best parameters:", self.best_params_, "with score %0.4f" % self.best_score_)
+
+        if self.refit:
+            self.best_estimator_ = clone(self.estimator).set_params(**self.best_params_).fit(x_train, y_train, s_train)
+        return self
+
+    def _evaluate(self, x_train, y_train, s_train, candidates, folds, fold_seeds):
+        """Fit and score the candidates on the folds. The kernel matrix is computed once for each kernel and gamma.
+
+        Returns
+        ----------
+        results: list
+            A dict of the mean scores for each candidate, with the keys of cv_results_.
+        """
+        results = [None] * len(candidates)
+        kernel_keys = sorted({self._kernel_key(params) for params in candidates}, key=repr)
+        for kernel_key in kernel_keys:
+            kernel_estimator = clone(self.estimator).set_params(**dict(kernel_key))
+            kernel_matr = kernel_estimator.kernel_function(x_train, x_train,
+                                                           out=np.empty((len(y_train), len(y_train)), dtype=kernel_estimator.dtype))
+            # Candidates that only differ in reg_beta share the cvxpy problems and the solutions of each fold,
+            # if they have the same reasonable points
+            problem_caches = {}
+            scores = {}
+            for fold, (train, test) in enumerate(folds):
+                kernel_train = kernel_matr[np.ix_(train, train)]
+                kernel_test = kernel_matr[np.ix_(test, train)]
+                for index, params in enumerate(candidates):
+                    if self._kernel_key(params) != kernel_key:
+                        continue
+                    problem_key = (fold, repr(sorted((key, value) for key, value in params.items() if key != 'reg_beta')))
+                    model = clone(self.estimator).set_params(**params)
+                    model.set_params(kernel='precomputed')
+                    if model.random_state is None:
+                        model.set_params(random_state=fold_seeds[fold])
+                    model.problem_cache = problem_caches.setdefault(problem_key, {})
+                    start = time.perf_counter()
+                    model.fit(kernel_train, y_train[train], s_train[train])
+                    fit_time = time.perf_counter() - start
+                    y_predicted = model.predict(kernel_test)
+                    DDP, DEO = model.compute_fairness_measures(y_predicted, y_train[test], s_train[test])
+                    if self.scoring == 'accuracy':
+                        score = np.mean(y_predicted == y_train[test])
+                    else:
+                        score = self.scoring(y_train[test], y_predicted, s_train[test])
+                    fairness = DDP if model.fairness_notion == 'DDP' else DEO
+                    scores.setdefault(index, []).append((fit_time, np.mean(y_predicted == y_train[test]),
+                                                         DDP, DEO, abs(fairness), score))
+            for index, fold_scores in scores.items():
+                fit_time, accuracy, DDP, DEO, abs_fairness, score = np.array(fold_scores).T
+                results[index] = {'mean_fit_time': np.mean(fit_time),
+                                  'mean_test_accuracy': np.mean(accuracy), 'std_test_accuracy': np.std(accuracy),
+                                  'mean_test_DDP': np.mean(DDP), 'mean_test_DEO': np.mean(DEO),
+                                  'mean_test_abs_fairness': np.mean(abs_fairness),
+                                  'mean_test_score': np.mean(score), 'std_test_score': np.std(score),
+                                  'feasible': self.fairness_threshold is None or np.mean(abs_fairness) <= self.fairness_threshold}
+                if self.verbose:
+                    print(candidates[index], "score %0.4f, |%s| %0.4f"
+                          % (results[index]['mean_test_score'], self.estimator.fairness_notion, results[index]['mean_test_abs_fairness']))
+        return results
+
+    def _kernel_key(self, params):
+        """The parameters of a candidate that determine its kernel matrix."""
+        kernel = params.get('kernel', self.estimator.kernel)
+        gamma = params.get('gamma', self.estimator.gamma)
+        return (('kernel', kernel), ('gamma', gamma))
+
+    def _rank_key(self, result):
+        """Sort key of a candidate: the feasible ones by decreasing score, then the others by increasing fairness measure."""
+        if result['feasible']:
+            return (0, -result['mean_test_score'])
+        return (1, result['mean_test_abs_fairness'])
+
+    def predict(self, x_test):
+        """Predict the label of test data with the best candidate.
+
+        Parameters
+        ----------
+        x_test: numpy array
+            The features of the test data with shape=(number_points,number_features).
+
+        Returns
+        ----------
+        y_hat: numpy array
+            The predicted class labels with shape=(number_points,).
+        """
+        return self.best_estimator_.predict(x_test)
+
+    def decision_function(self, x_test):
+        """Compute the real-valued output of the best candidate, whose sign is the predicted label."""
+        return self.best_estimator_.decision_function(x_test)
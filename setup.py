@@ -24,6 +24,7 @@ setuptools.setup(
     install_requires=[
         "numpy>=1.18.1",
         "cvxpy>=1.1.0",
+        "scipy>=1.4.1",
         "scikit-learn>=0.22.1",
         "pandas>=1.0.1",
         "matplotlib>=3.1.3"